@@ -0,0 +1,5 @@
+"""Shared code of the simulate-*.py scripts.
+
+The modules are kept import-light: sinks, metrics, schedule and state need only the
+standard library, while route and vehicle bring in requests and the route model.
+"""
@@ -0,0 +1,224 @@
+"""Latency statistics and Prometheus metrics served over HTTP or a Unix socket."""
+
+import bisect
+import http.server
+import os
+import random
+import socketserver
+import threading
+import time
+
+from .sinks import FanOutSink, RedisSink
+
+
+class LatencyStats:
+    """Count, mean and max of a latency, plus a bounded sample for percentiles."""
+    def __init__(self, max_samples=1000):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = []
+        self.max_samples = max_samples
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        if len(self.samples) < self.max_samples:
+            self.samples.append(seconds)
+        else:
+            # Reservoir sampling keeps the sample representative of the whole run
+            i = random.randrange(self.count)
+            if i < self.max_samples:
+                self.samples[i] = seconds
+
+    def percentile(self, fraction):
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def summary(self):
+        if not self.count:
+            return "none"
+        return (f"{self.count}, avg {self.total / self.count * 1000:.0f}ms, "
+                f"p95 {self.percentile(0.95) * 1000:.0f}ms, max {self.max * 1000:.0f}ms")
+
+
+class Counter:
+    """Monotonic counter that any thread can increment without a lock.
+
+    Each thread adds to its own cell and a scrape sums the cells, so the
+    tick loop and the routing threads never race on the same value.
+    """
+    def __init__(self):
+        self.cells = {}
+
+    def inc(self, amount=1):
+        ident = threading.get_ident()
+        self.cells[ident] = self.cells.get(ident, 0) + amount
+
+    @property
+    def value(self):
+        return sum(list(self.cells.values()))
+
+
+class Histogram:
+    """Prometheus-style histogram, observed from a single thread and read from any."""
+    def __init__(self, buckets):
+        self.buckets = sorted(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)     # Per bucket, the last one for +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+# Bucket bounds in seconds for tick durations and schedule lag
+TICK_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+class Metrics:
+    """Counters, gauges and histograms rendered in the Prometheus text format.
+
+    Values updated in the hot loop are Counter and Histogram objects that
+    cost a few dictionary or list operations per update; everything else is
+    a callback evaluated only when scraped.
+    """
+    def __init__(self, stale_after=None):
+        self.metrics = {}   # Name -> (type, help, source, label name)
+        self.last_beat = time.monotonic()
+        self.stale_after = stale_after
+
+    def register(self, name, kind, help_text, source, label=None):
+        """Add a metric whose source() returns a number, or a dict of label value -> number"""
+        self.metrics[name] = (kind, help_text, source, label)
+
+    def counter(self, name, help_text):
+        counter = Counter()
+        self.register(name, "counter", help_text, counter)
+        return counter
+
+    def histogram(self, name, help_text, buckets=TICK_BUCKETS):
+        histogram = Histogram(buckets)
+        self.register(name, "histogram", help_text, histogram)
+        return histogram
+
+    def beat(self):
+        """Record that the simulation loop is alive"""
+        self.last_beat = time.monotonic()
+
+    def health(self):
+        """(healthy, message) from the time since the last beat()"""
+        age = time.monotonic() - self.last_beat
+        if self.stale_after is not None and age > self.stale_after:
+            return False, f"stalled: last tick {age:.1f}s ago"
+        return True, f"ok: last tick {age:.1f}s ago"
+
+    def render(self):
+        lines = []
+        for name, (kind, help_text, source, label) in self.metrics.items():
+            if isinstance(source, Histogram):
+                # Snapshot first so the buckets and the count agree
+                counts = list(source.counts)
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+                cumulative = 0
+                for bound, count in zip(source.buckets, counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{le="{bound:g}"}} {cumulative}')
+                cumulative += counts[-1]
+                lines += [f'{name}_bucket{{le="+Inf"}} {cumulative}', f"{name}_sum {source.sum:.6f}",
+                          f"{name}_count {cumulative}"]
+                continue
+
+            try:
+                value = source.value if isinstance(source, Counter) else source()
+            except RuntimeError:
+                # A collection changed size under a concurrent scrape; skip it this time
+                continue
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            if isinstance(value, dict):
+                lines += [f'{name}{{{label}="{key}"}} {item:g}' for key, item in value.items()]
+            else:
+                lines.append(f"{name} {value:g}")
+        lines.append("# HELP simulator_last_tick_age_seconds Time since the simulation loop last ran")
+        lines.append("# TYPE simulator_last_tick_age_seconds gauge")
+        lines.append(f"simulator_last_tick_age_seconds {time.monotonic() - self.last_beat:.3f}")
+        return "\n".join(lines) + "\n"
+
+
+def register_sink_metrics(metrics, sink):
+    """Add the write, drop and error counts of every sink behind sink"""
+    sinks = sink.sinks if isinstance(sink, FanOutSink) else [sink]
+    names = []
+    for i, s in enumerate(sinks):
+        # Number repeated sink types so each gets its own series
+        same = sum(1 for other in sinks[:i] if other.name == s.name)
+        names.append(f"{s.name}-{same + 1}" if same else s.name)
+    for counter, help_text in (("writes", "Batches, records or sentences written, by sink"),
+                               ("merged", "Batches merged into a queued one because a sink could not keep up, by sink"),
+                               ("dropped", "Updates dropped because a sink could not keep up, by sink"),
+                               ("errors", "Failed writes, by sink")):
+        metrics.register(f"simulator_sink_{counter}_total", "counter", help_text,
+                         lambda counter=counter: {name: s.counters().get(counter, 0) for name, s in zip(names, sinks)},
+                         "sink")
+    redis_sinks = [(name, s) for name, s in zip(names, sinks) if isinstance(s, RedisSink)]
+    if redis_sinks:
+        metrics.register("simulator_redis_queue_depth", "gauge", "Batches waiting for the Redis writer",
+                         lambda: {name: s.depth() for name, s in redis_sinks}, "sink")
+
+
+METRICS_HELP = "Serve Prometheus metrics on /metrics and a /health check at PORT, HOST:PORT or unix:PATH"
+
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path == "/metrics":
+            status, body = 200, self.server.metrics.render()
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        elif path == "/health":
+            healthy, message = self.server.metrics.health()
+            status, body, content_type = (200 if healthy else 503), message + "\n", "text/plain; charset=utf-8"
+        else:
+            status, body, content_type = 404, "Not found\n", "text/plain; charset=utf-8"
+        data = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        # Keep scrapes out of the simulator's status output
+        pass
+
+
+class MetricsServer:
+    """Serves a Metrics instance over HTTP on a TCP port or a Unix socket from a daemon thread."""
+    def __init__(self, metrics, address):
+        self.socket_path = None
+        if address.startswith("unix:"):
+            self.socket_path = address[len("unix:"):]
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)     # Left over from a previous run
+            self.server = socketserver.ThreadingUnixStreamServer(self.socket_path, MetricsHandler)
+        else:
+            host, _, port = address.rpartition(":")
+            self.server = http.server.ThreadingHTTPServer((host or "127.0.0.1", int(port)), MetricsHandler)
+        self.server.daemon_threads = True
+        self.server.metrics = metrics
+        self.thread = threading.Thread(target=self.server.serve_forever, name="metrics", daemon=True)
+        self.thread.start()
+
+    def describe(self):
+        if self.socket_path:
+            return f"unix:{self.socket_path}"
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/metrics"
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self.socket_path and os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
@@ -0,0 +1,881 @@
+"""Routes from Valhalla, their geometry and the elevation and speed-limit data along them."""
+
+import bisect
+import collections
+import hashlib
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+from array import array
+from multiprocessing import shared_memory
+
+import requests
+
+from .metrics import Counter
+
+
+VALHALLA_URL = "https://valhalla1.openstreetmap.de"
+VALHALLA_TIMEOUT = (5, 30)  # Seconds to connect and to wait for a response
+
+# Outcome of every get_route() call
+ROUTE_REQUESTS = {"cache-hit": Counter(), "fetched": Counter(), "failed": Counter()}
+
+
+def route_cache_path(cache_dir, start, end):
+    """Cached Valhalla response for a start/end pair, named like the sample valhalla-route-*.json files"""
+    return os.path.join(cache_dir, f"valhalla-route-{start[0]}-{start[1]}-to-{end[0]}-{end[1]}.json")
+
+
+def speed_limits_cache_path(cache_dir, shape):
+    """Cached trace_attributes response for an encoded route shape"""
+    digest = hashlib.sha1(shape.encode()).hexdigest()[:16]
+    return os.path.join(cache_dir, f"valhalla-speed-limits-{digest}.json")
+
+
+def read_cached_response(cache_path):
+    """A cached Valhalla response, or None when there is none"""
+    if not cache_path or not os.path.exists(cache_path):
+        return None
+    try:
+        with open(cache_path) as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Ignoring unreadable cached response {cache_path}: {e}")
+        return None
+
+
+def cache_response(cache_path, data):
+    """Save a Valhalla response for read_cached_response()"""
+    # Write to a temporary file first so concurrent readers never see a partial response
+    temp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(temp_path, cache_path)
+    except OSError as e:
+        print(f"Could not cache Valhalla response in {cache_path}: {e}")
+
+
+def parse_valhalla_route(route_data):
+    """Build a Route from a Valhalla /route response"""
+    leg = route_data['trip']['legs'][0]
+    # The first maneuver is the departure, every later one starts at a turn or the arrival
+    maneuver_indices = [m['begin_shape_index'] for m in leg.get('maneuvers', [])[1:]]
+    return Route(decode_polyline(leg['shape'], 6), maneuver_indices, leg.get('summary', {}).get('time'))
+
+
+def get_route(start, end, valhalla_url=VALHALLA_URL, cache_dir=None):
+    """Get a route from Valhalla, or from a response cached in cache_dir.
+
+    valhalla_url may point at a local Valhalla instance. With cache_dir,
+    responses are read from and saved to route_cache_path().
+    """
+    cache_path = route_cache_path(cache_dir, start, end) if cache_dir else None
+    cached = read_cached_response(cache_path)
+    if cached is not None:
+        try:
+            route = parse_valhalla_route(cached)
+            ROUTE_REQUESTS["cache-hit"].inc()
+            return route
+        except (ValueError, KeyError, IndexError) as e:
+            print(f"Ignoring unusable cached route {cache_path}: {e}")
+
+    request_data = {
+        "locations": [
+            {"lat": start[0], "lon": start[1]},
+            {"lat": end[0], "lon": end[1]}
+        ],
+        "costing": "motor_scooter",
+        "units": "kilometers"
+    }
+
+    try:
+        response = requests.post(f"{valhalla_url}/route", json=request_data, timeout=VALHALLA_TIMEOUT)
+        response.raise_for_status()
+        route_data = response.json()
+        route = parse_valhalla_route(route_data)
+    except requests.exceptions.RequestException as e:
+        print(f"Error getting route from Valhalla: {e}")
+        ROUTE_REQUESTS["failed"].inc()
+        return None
+    except (ValueError, KeyError, IndexError) as e:
+        print(f"Unexpected Valhalla response: {e}")
+        ROUTE_REQUESTS["failed"].inc()
+        return None
+    ROUTE_REQUESTS["fetched"].inc()
+
+    if cache_path:
+        cache_response(cache_path, route_data)
+    return route
+
+
+def parse_speed_limits(trace, buffer_m=15.0):
+    """Build a SpeedLimitMap from a Valhalla trace_attributes response"""
+    shape = Route(decode_polyline(trace['shape'], 6), []).points()
+    zones = []
+    for edge in trace.get('edges', []):
+        speed_limit = parse_maxspeed(edge.get('speed_limit'))
+        if speed_limit is None:
+            continue
+        line = shape[edge['begin_shape_index']:edge['end_shape_index'] + 1]
+        if len(line) < 2:
+            continue
+        zones.append(SpeedLimitZone(
+            speed_limit, lines=[line],
+            road_name=(edge.get('names') or [""])[0],
+            road_type=edge.get('road_class', ""),
+            buffer_m=buffer_m
+        ))
+    return SpeedLimitMap(zones)
+
+
+def get_route_speed_limits(route, valhalla_url=VALHALLA_URL, cache_dir=None, buffer_m=15.0):
+    """Get per-edge speed limits along a route from Valhalla's trace_attributes.
+
+    Takes the same valhalla_url and cache_dir as get_route(), so routes and
+    their speed limits come from one server; responses are cached under
+    speed_limits_cache_path().
+    """
+    shape = route.to_dict()["shape"] if isinstance(route, Route) else encode_polyline(route, 6)
+    cache_path = speed_limits_cache_path(cache_dir, shape) if cache_dir else None
+    cached = read_cached_response(cache_path)
+    if cached is not None:
+        try:
+            return parse_speed_limits(cached, buffer_m)
+        except (KeyError, ValueError, IndexError) as e:
+            print(f"Ignoring unusable cached speed limits {cache_path}: {e}")
+
+    request_data = {
+        "encoded_polyline": shape,
+        "shape_match": "edge_walk",
+        "costing": "motor_scooter",
+        "filters": {
+            "attributes": [
+                "shape",
+                "edge.speed_limit",
+                "edge.names",
+                "edge.road_class",
+                "edge.begin_shape_index",
+                "edge.end_shape_index",
+            ],
+            "action": "include"
+        }
+    }
+
+    try:
+        response = requests.post(f"{valhalla_url}/trace_attributes", json=request_data, timeout=VALHALLA_TIMEOUT)
+        response.raise_for_status()
+        trace = response.json()
+        speed_limits = parse_speed_limits(trace, buffer_m)
+    except (requests.exceptions.RequestException, KeyError, ValueError, IndexError) as e:
+        print(f"Error getting speed limits from Valhalla: {e}")
+        return None
+    if cache_path:
+        cache_response(cache_path, trace)
+    return speed_limits
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Calculate the distance between two points in meters."""
+    R = 6371000  # Earth radius in meters
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    delta_phi = math.radians(lat2 - lat1)
+    delta_lambda = math.radians(lon2 - lon1)
+
+    a = math.sin(delta_phi / 2) * math.sin(delta_phi / 2) + \
+        math.cos(phi1) * math.cos(phi2) * \
+        math.sin(delta_lambda / 2) * math.sin(delta_lambda / 2)
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+    return R * c
+
+
+def calculate_bearing(lat1, lon1, lat2, lon2):
+    """Calculate bearing from point 1 to point 2 in degrees."""
+    lat1_rad = math.radians(lat1)
+    lat2_rad = math.radians(lat2)
+    dLon = math.radians(lon2 - lon1)
+
+    y = math.sin(dLon) * math.cos(lat2_rad)
+    x = math.cos(lat1_rad) * math.sin(lat2_rad) - \
+        math.sin(lat1_rad) * math.cos(lat2_rad) * math.cos(dLon)
+
+    bearing = math.degrees(math.atan2(y, x))
+    return (bearing + 360) % 360
+
+
+def destination_point(lat, lon, bearing, distance):
+    """Position after moving distance meters from (lat, lon) along bearing (degrees)."""
+    bearing_rad = math.radians(bearing)
+    # 1 degree latitude ≈ 111,111 meters, 1 degree longitude ≈ 111,111 * cos(latitude) meters
+    lat2 = lat + distance * math.cos(bearing_rad) / 111111
+    lon2 = lon + distance * math.sin(bearing_rad) / (111111 * math.cos(math.radians(lat)))
+    return lat2, lon2
+
+
+def calculate_turn_angle(bearing1, bearing2):
+    """Calculate the turn angle between two bearings (absolute value)."""
+    diff = abs(bearing2 - bearing1)
+    if diff > 180:
+        diff = 360 - diff
+    return diff
+
+
+def decode_polyline(shape, precision=6):
+    """Decode an encoded polyline straight into a flat array('d') of lat, lon pairs.
+
+    Streams over the encoded bytes without building per-point tuples, so a
+    decoded route costs 16 bytes per point instead of a list of float tuples.
+    """
+    coords = array('d')
+    data = shape.encode('ascii')
+    factor = 10.0 ** precision
+    length = len(data)
+    index = 0
+    lat = 0
+    lon = 0
+    while index < length:
+        for axis in range(2):
+            result = 0
+            shift = 0
+            while True:
+                b = data[index] - 63
+                index += 1
+                result |= (b & 0x1f) << shift
+                shift += 5
+                if b < 0x20:
+                    break
+            delta = ~(result >> 1) if result & 1 else result >> 1
+            if axis == 0:
+                lat += delta
+            else:
+                lon += delta
+        coords.append(lat / factor)
+        coords.append(lon / factor)
+    return coords
+
+
+def encode_polyline(points, precision=6):
+    """Encode (lat, lon) points as a polyline string."""
+    factor = 10 ** precision
+    chunks = []
+    prev_lat = 0
+    prev_lon = 0
+    for lat, lon in points:
+        lat_e = round(lat * factor)
+        lon_e = round(lon * factor)
+        for delta in (lat_e - prev_lat, lon_e - prev_lon):
+            value = ~(delta << 1) if delta < 0 else delta << 1
+            while value >= 0x20:
+                chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+                value >>= 5
+            chunks.append(chr(value + 63))
+        prev_lat, prev_lon = lat_e, lon_e
+    return "".join(chunks)
+
+
+class Route:
+    """Route geometry with precomputed cumulative distances and maneuver points.
+
+    Waypoints live in a flat buffer of doubles (lat0, lon0, lat1, lon1, ...)
+    and cumulative distances in a parallel one: array('d') for routes built
+    in-process, or zero-copy memoryviews into shared memory when attached
+    with from_shared_memory(). Indexing still yields (lat, lon) tuples, so
+    progress along the route (remaining distance, distance to the next
+    maneuver) is an O(1) lookup instead of re-summing segments every tick.
+    """
+    def __init__(self, coords, maneuver_indices=None, duration=None, cumulative_distance=None):
+        self.coords = coords
+        count = len(coords) // 2
+
+        # cumulative_distance[i] is the distance in meters from the start to waypoint i
+        if cumulative_distance is None:
+            cumulative_distance = array('d', bytes(8 * count))
+            for i in range(1, count):
+                cumulative_distance[i] = cumulative_distance[i - 1] + haversine(
+                    coords[2 * i - 2], coords[2 * i - 1], coords[2 * i], coords[2 * i + 1])
+        self.cumulative_distance = cumulative_distance
+        self.length = cumulative_distance[-1] if count else 0.0
+
+        if maneuver_indices is None:
+            maneuver_indices = find_turn_indices(self)
+        self.maneuver_indices = sorted(set(i for i in maneuver_indices if 0 < i < count))
+
+        # Expected duration in seconds (from the routing backend when known)
+        self.duration = duration
+
+        # Per-waypoint elevation in meters and per-segment grade, see compute_elevations()
+        self.elevations = None
+        self.grades = None
+
+        # Segment index for snap(), built on first use
+        self.segment_grid = None
+        self.snap_radius = 50.0
+
+        self.shared_memory = None
+        self.encoded_shape = None   # Polyline cached by to_dict(), the geometry never changes
+
+    @classmethod
+    def from_points(cls, points, maneuver_indices=None, duration=None):
+        """Build a route from a sequence of (lat, lon) pairs."""
+        coords = array('d')
+        for lat, lon in points:
+            coords.append(lat)
+            coords.append(lon)
+        return cls(coords, maneuver_indices, duration)
+
+    def to_dict(self):
+        """JSON-compatible form for checkpoints; Valhalla shapes survive the polyline6 round trip exactly"""
+        if self.encoded_shape is None:
+            self.encoded_shape = encode_polyline(self.points(), 6)
+        return {"shape": self.encoded_shape, "maneuver_indices": self.maneuver_indices, "duration": self.duration}
+
+    @classmethod
+    def from_dict(cls, data):
+        route = cls(decode_polyline(data["shape"], 6), data["maneuver_indices"], data.get("duration"))
+        route.encoded_shape = data["shape"]
+        return route
+
+    def to_shared_memory(self):
+        """Copy the route into a new shared memory block for other processes to attach to.
+
+        Layout (doubles): point count, maneuver count, duration (NaN if unknown),
+        coords, cumulative distances, maneuver indices. The caller owns the
+        block and must close() and unlink() it once every user is done.
+
+        Returns: the SharedMemory block; pass its name to from_shared_memory()
+        """
+        count = len(self)
+        header = array('d', [count, len(self.maneuver_indices),
+                             math.nan if self.duration is None else self.duration])
+        maneuvers = array('d', self.maneuver_indices)
+        size = 8 * (len(header) + 3 * count + len(maneuvers))
+        block = shared_memory.SharedMemory(create=True, size=max(size, 8))
+        view = block.buf.cast('d')
+        offset = 0
+        for part in (header, self.coords, self.cumulative_distance, maneuvers):
+            view[offset:offset + len(part)] = array('d', part)
+            offset += len(part)
+        view.release()
+        return block
+
+    @classmethod
+    def from_shared_memory(cls, name):
+        """Attach read-only to a route published with to_shared_memory(), without copying it."""
+        if sys.version_info >= (3, 13):
+            # Only the creating process should unlink the block
+            block = shared_memory.SharedMemory(name=name, track=False)
+        else:
+            block = shared_memory.SharedMemory(name=name)
+        view = block.buf.toreadonly().cast('d')
+        count = int(view[0])
+        maneuver_count = int(view[1])
+        duration = None if math.isnan(view[2]) else view[2]
+        coords = view[3:3 + 2 * count]
+        cumulative_distance = view[3 + 2 * count:3 + 3 * count]
+        maneuvers = [int(i) for i in view[3 + 3 * count:3 + 3 * count + maneuver_count]]
+
+        route = cls(coords, maneuvers, duration, cumulative_distance)
+        route.shared_memory = (block, view)
+        return route
+
+    def close(self):
+        """Detach from shared memory; the route must not be used afterwards."""
+        if self.shared_memory is not None:
+            block, view = self.shared_memory
+            self.coords.release()
+            self.cumulative_distance.release()
+            view.release()
+            block.close()
+            self.shared_memory = None
+
+    def compute_elevations(self, elevation_model, max_grade=0.25):
+        """Sample the elevation of every waypoint once and derive segment grades.
+
+        Waypoints outside the available tiles reuse the previous elevation,
+        and grades are clamped to filter out DEM noise on very short segments.
+        """
+        elevations = array('d')
+        last = 0.0
+        for lat, lon in self:
+            elevation = elevation_model.elevation(lat, lon)
+            if elevation is None:
+                elevation = last
+            elevations.append(elevation)
+            last = elevation
+
+        grades = array('d')
+        for i in range(len(self) - 1):
+            run = self.cumulative_distance[i + 1] - self.cumulative_distance[i]
+            grade = (elevations[i + 1] - elevations[i]) / run if run >= 1 else 0.0
+            grades.append(max(-max_grade, min(max_grade, grade)))
+
+        self.elevations = elevations
+        self.grades = grades
+
+    def __len__(self):
+        return len(self.coords) // 2
+
+    def __getitem__(self, index):
+        # Negative and out-of-range indices map onto the flat buffer's own handling
+        coords = self.coords
+        return coords[2 * index], coords[2 * index + 1]
+
+    def points(self):
+        """All waypoints as a list of (lat, lon) tuples."""
+        return list(zip(self.coords[0::2], self.coords[1::2]))
+
+    def next_maneuver_index(self, waypoint_index):
+        """First maneuver waypoint strictly ahead of waypoint_index, or None."""
+        i = bisect.bisect_right(self.maneuver_indices, waypoint_index)
+        return self.maneuver_indices[i] if i < len(self.maneuver_indices) else None
+
+    def _build_segment_grid(self):
+        grid = SpatialGrid()
+        pad_lat = self.snap_radius / 111320.0
+        for i in range(len(self) - 1):
+            a = self[i]
+            b = self[i + 1]
+            pad_lon = pad_lat / max(0.01, math.cos(math.radians(a[0])))
+            grid.insert(i, min(a[0], b[0]) - pad_lat, min(a[1], b[1]) - pad_lon,
+                        max(a[0], b[0]) + pad_lat, max(a[1], b[1]) + pad_lon)
+        self.segment_grid = grid
+
+    def snap(self, lat, lon, from_index=0):
+        """Map-match a position to the nearest route segment within snap_radius meters.
+
+        Where the route passes the same spot twice, segments before from_index
+        are only chosen when clearly closer, so a rider keeps moving forward.
+
+        Returns: (segment_index, distance_along, offset, (lat, lon)) or None when off the route
+        """
+        if len(self) < 2:
+            return None
+        if self.segment_grid is None:
+            self._build_segment_grid()
+
+        coords = self.coords
+        best = None
+        best_score = None
+        for i in self.segment_grid.query(lat, lon):
+            offset, t = point_segment_distance(lat, lon, (coords[2 * i], coords[2 * i + 1]),
+                                               (coords[2 * i + 2], coords[2 * i + 3]))
+            if offset > self.snap_radius:
+                continue
+            score = offset + (20.0 if i < from_index else 0.0)
+            if best is None or score < best_score:
+                best = (i, t, offset)
+                best_score = score
+        if best is None:
+            return None
+
+        i, t, offset = best
+        a = self[i]
+        b = self[i + 1]
+        point = (a[0] + (b[0] - a[0]) * t, a[1] + (b[1] - a[1]) * t)
+        distance_along = self.cumulative_distance[i] + (self.cumulative_distance[i + 1] - self.cumulative_distance[i]) * t
+        return i, distance_along, offset, point
+
+
+# File size in bytes -> samples per side: 1201 for SRTM3, 3601 for SRTM1 tiles
+HGT_SIZES = {2 * n * n: n for n in (1201, 3601)}
+
+
+class ElevationModel:
+    """SRTM .hgt elevation tiles, memory-mapped and sampled bilinearly.
+
+    path is a single tile or a directory of tiles named like N52E013.hgt.
+    Tiles are mapped on first use and stay mapped, so sampling never reads
+    the file explicitly; the OS pages in only the rows that are touched.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.tiles = {}   # Tile name -> (mmap, samples per side), or None if unavailable
+
+    @staticmethod
+    def tile_name(lat, lon):
+        lat_floor = math.floor(lat)
+        lon_floor = math.floor(lon)
+        return (f"{'N' if lat_floor >= 0 else 'S'}{abs(lat_floor):02d}"
+                f"{'E' if lon_floor >= 0 else 'W'}{abs(lon_floor):03d}.hgt")
+
+    def _tile(self, name):
+        if name in self.tiles:
+            return self.tiles[name]
+
+        if os.path.isdir(self.path):
+            tile_path = os.path.join(self.path, name)
+        elif os.path.basename(self.path).upper() == name.upper():
+            tile_path = self.path
+        else:
+            tile_path = None
+
+        tile = None
+        if tile_path and os.path.exists(tile_path):
+            file_size = os.path.getsize(tile_path)
+            size = HGT_SIZES.get(file_size)
+            if size is None:
+                print(f"Elevation tile {tile_path} has {file_size} bytes, not an SRTM1 or SRTM3 tile; "
+                      "assuming flat ground there")
+            else:
+                with open(tile_path, 'rb') as f:
+                    tile = (mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), size)
+        else:
+            print(f"No elevation tile {name} in {self.path}, assuming flat ground there")
+        self.tiles[name] = tile
+        return tile
+
+    def elevation(self, lat, lon):
+        """Elevation in meters at a point, or None outside the available tiles."""
+        tile = self._tile(self.tile_name(lat, lon))
+        if tile is None:
+            return None
+        data, size = tile
+
+        # Rows run north to south, columns west to east, both including the tile edges
+        row = (math.floor(lat) + 1 - lat) * (size - 1)
+        col = (lon - math.floor(lon)) * (size - 1)
+        r0 = min(int(row), size - 2)
+        c0 = min(int(col), size - 2)
+        fr = row - r0
+        fc = col - c0
+
+        def sample(r, c):
+            value = struct.unpack_from('>h', data, 2 * (r * size + c))[0]
+            return None if value == -32768 else value  # SRTM void
+
+        corners = [sample(r0, c0), sample(r0, c0 + 1), sample(r0 + 1, c0), sample(r0 + 1, c0 + 1)]
+        valid = [v for v in corners if v is not None]
+        if not valid:
+            return None
+        if len(valid) < 4:
+            return sum(valid) / len(valid)
+        top = corners[0] + (corners[1] - corners[0]) * fc
+        bottom = corners[2] + (corners[3] - corners[2]) * fc
+        return top + (bottom - top) * fr
+
+
+def find_turn_indices(waypoints, min_turn_angle=30):
+    """Waypoints where the route turns by at least min_turn_angle degrees, plus the arrival."""
+    indices = []
+    prev_bearing = None
+    for i in range(len(waypoints) - 1):
+        wp1 = waypoints[i]
+        wp2 = waypoints[i + 1]
+        if haversine(wp1[0], wp1[1], wp2[0], wp2[1]) < 0.1:
+            continue
+        bearing = calculate_bearing(wp1[0], wp1[1], wp2[0], wp2[1])
+        if prev_bearing is not None and calculate_turn_angle(prev_bearing, bearing) >= min_turn_angle:
+            indices.append(i)
+        prev_bearing = bearing
+    if waypoints:
+        indices.append(len(waypoints) - 1)
+    return indices
+
+
+def describe_turn(turn_angle):
+    """Rider-facing label for the sharpest turn ahead"""
+    if turn_angle < 15:
+        return "straight"
+    elif turn_angle < 30:
+        return "gentle turn"
+    elif turn_angle < 60:
+        return "sharp turn"
+    elif turn_angle < 90:
+        return "very sharp"
+    return "hairpin"
+
+
+class SpeedProfile:
+    """Planned speed along a whole route, computed once when the route is set.
+
+    Every waypoint gets the highest speed a rider would take it at: the
+    corner speed for the lateral-acceleration limit (the radius comes from
+    how far the rider can cut the corner), capped by max_speed and any
+    speed limit there. A backward pass then makes every corner reachable
+    with comfortable braking, and a forward pass limits acceleration out of
+    it, both on v^2 over the cumulative-distance array. Between waypoints
+    speed_at() takes the lower of accelerating out of one and braking for the
+    next, so a long segment between two slow corners still reaches cruising
+    speed. Ticks only look the plan up with speed_at().
+    """
+    def __init__(self, route, max_speed, acceleration, deceleration, lateral_acceleration=2.0,
+                 start_speed=0.0, speed_limit_maps=(), corner_cut=10.0, min_corner_speed=8.0,
+                 turn_look_ahead=50.0):
+        count = len(route)
+        distance = route.cumulative_distance
+        v_max = max_speed / 3.6
+        accel = acceleration / 3.6
+        decel = deceleration / 3.6
+
+        turn_angles = array('d', bytes(8 * count))
+        speeds = array('d', [v_max]) * count
+        limits = array('d', [v_max]) * count   # Speed ceiling from max_speed and speed limits alone
+        for i in range(1, count - 1):
+            a, at, b = route[i - 1], route[i], route[i + 1]
+            turn_angle = calculate_turn_angle(calculate_bearing(a[0], a[1], at[0], at[1]),
+                                              calculate_bearing(at[0], at[1], b[0], b[1]))
+            turn_angles[i] = turn_angle
+            if turn_angle >= 1:
+                cut = min(corner_cut, (distance[i] - distance[i - 1]) / 2, (distance[i + 1] - distance[i]) / 2)
+                radius = cut / math.tan(math.radians(min(turn_angle, 179)) / 2)
+                speeds[i] = min(v_max, max(min_corner_speed / 3.6, math.sqrt(lateral_acceleration * radius)))
+
+        for speed_limit_map in speed_limit_maps:
+            if speed_limit_map is None:
+                continue
+            for i in range(count):
+                zone = speed_limit_map.lookup(*route[i])
+                if zone is not None and zone.speed_kmh() is not None:
+                    limits[i] = min(limits[i], zone.speed_kmh() / 3.6)
+                    speeds[i] = min(speeds[i], limits[i])
+
+        if count:
+            speeds[0] = min(speeds[0], max(start_speed / 3.6, min_corner_speed / 3.6))
+            speeds[-1] = min_corner_speed / 3.6
+
+        # Backward pass: brake in time for every slower point ahead
+        for i in range(count - 2, -1, -1):
+            reachable = math.sqrt(speeds[i + 1] ** 2 + 2 * decel * (distance[i + 1] - distance[i]))
+            if reachable < speeds[i]:
+                speeds[i] = reachable
+        # Forward pass: accelerate out of each slow point
+        for i in range(1, count):
+            reachable = math.sqrt(speeds[i - 1] ** 2 + 2 * accel * (distance[i] - distance[i - 1]))
+            if reachable < speeds[i]:
+                speeds[i] = reachable
+
+        # Sharpest turn within turn_look_ahead meters after each waypoint (sliding window maximum)
+        turn_ahead = array('d', bytes(8 * count))
+        window = collections.deque()
+        for i in range(count - 2, -1, -1):
+            while window and turn_angles[window[0]] <= turn_angles[i + 1]:
+                window.popleft()
+            window.appendleft(i + 1)
+            while distance[window[-1]] - distance[i] > turn_look_ahead:
+                window.pop()
+                if not window:
+                    break
+            turn_ahead[i] = turn_angles[window[-1]] if window else 0.0
+
+        self.distance = distance
+        self.speeds = array('d', (v * 3.6 for v in speeds))
+        self.limits = array('d', (v * 3.6 for v in limits))
+        self.turn_angles = turn_angles
+        self.turn_ahead = turn_ahead
+        # (km/h)^2 gained per meter of accelerating and shed per meter of braking
+        self.acceleration_v2 = 2 * accel * 3.6 ** 2
+        self.deceleration_v2 = 2 * decel * 3.6 ** 2
+
+    def speed_at(self, distance_along):
+        """Planned speed in km/h at distance_along meters from the route start"""
+        distance = self.distance
+        speeds = self.speeds
+        i = bisect.bisect_right(distance, distance_along) - 1
+        if i < 0:
+            return speeds[0]
+        if i >= len(speeds) - 1:
+            return speeds[-1]
+        travelled = distance_along - distance[i]
+        left = max(0.0, distance[i + 1] - distance_along)
+        # Constant acceleration makes v^2, not v, linear in distance
+        return min(math.sqrt(speeds[i] ** 2 + self.acceleration_v2 * travelled),
+                   math.sqrt(speeds[i + 1] ** 2 + self.deceleration_v2 * left),
+                   max(self.limits[i], self.limits[i + 1]))
+
+
+def point_segment_distance(lat, lon, a, b):
+    """Approximate distance in meters from a point to segment a-b.
+
+    Uses a local equirectangular projection, which is accurate to well under
+    a meter at street scale. Returns: (distance, t) where t in [0, 1] is the
+    position of the closest point along the segment.
+    """
+    meters_per_degree = 111320.0
+    cos_lat = math.cos(math.radians(lat))
+    ax = (a[1] - lon) * cos_lat * meters_per_degree
+    ay = (a[0] - lat) * meters_per_degree
+    bx = (b[1] - lon) * cos_lat * meters_per_degree
+    by = (b[0] - lat) * meters_per_degree
+
+    dx = bx - ax
+    dy = by - ay
+    length_sq = dx * dx + dy * dy
+    t = 0.0 if length_sq == 0 else max(0.0, min(1.0, -(ax * dx + ay * dy) / length_sq))
+    return math.hypot(ax + t * dx, ay + t * dy), t
+
+
+def point_in_ring(lat, lon, ring):
+    """Ray-casting point-in-polygon test for a ring of GeoJSON [lon, lat] positions."""
+    inside = False
+    j = len(ring) - 1
+    for i in range(len(ring)):
+        xi, yi = ring[i][0], ring[i][1]
+        xj, yj = ring[j][0], ring[j][1]
+        if (yi > lat) != (yj > lat) and lon < (xj - xi) * (lat - yi) / (yj - yi) + xi:
+            inside = not inside
+        j = i
+    return inside
+
+
+def point_in_polygon(lat, lon, rings):
+    """Point-in-polygon test for GeoJSON polygon rings (outer ring first, then holes)."""
+    return point_in_ring(lat, lon, rings[0]) and not any(point_in_ring(lat, lon, hole) for hole in rings[1:])
+
+
+class SpatialGrid:
+    """Uniform lat/lon grid that maps each cell to the items overlapping it.
+
+    A point query only looks at the items registered in its cell, so lookups
+    stay O(1) on average regardless of how many items are indexed. Items
+    spanning more than max_cells cells are kept in a short list that every
+    query checks instead of being copied into thousands of cells.
+    """
+    def __init__(self, cell_size=0.002, max_cells=4096):
+        self.cell_size = cell_size   # Degrees, ~200 m of latitude
+        self.max_cells = max_cells
+        self.cells = {}
+        self.large_items = []
+
+    def _cell(self, lat, lon):
+        return math.floor(lat / self.cell_size), math.floor(lon / self.cell_size)
+
+    def insert(self, item, min_lat, min_lon, max_lat, max_lon):
+        lat0, lon0 = self._cell(min_lat, min_lon)
+        lat1, lon1 = self._cell(max_lat, max_lon)
+        if (lat1 - lat0 + 1) * (lon1 - lon0 + 1) > self.max_cells:
+            self.large_items.append(item)
+            return
+        for cell_lat in range(lat0, lat1 + 1):
+            for cell_lon in range(lon0, lon1 + 1):
+                self.cells.setdefault((cell_lat, cell_lon), []).append(item)
+
+    def query(self, lat, lon):
+        """Items whose bounding box may contain the point (callers do the exact test)."""
+        items = self.cells.get(self._cell(lat, lon), [])
+        return items + self.large_items if self.large_items else items
+
+
+def parse_maxspeed(value):
+    """Convert an OSM-style maxspeed value to the km/h string the UI expects, or None."""
+    if value is None:
+        return None
+    value = str(value).strip().lower()
+    if value == "none":
+        return "none"
+    if value == "walk":
+        return "7"
+    try:
+        if value.endswith("mph"):
+            return str(round(float(value[:-3]) * 1.609))
+        speed = round(float(value.removesuffix("km/h")))
+    except ValueError:
+        return None
+    return str(speed) if speed > 0 else None
+
+
+class SpeedLimitZone:
+    """A polygon area or a buffered road line with a legal speed limit."""
+    def __init__(self, speed_limit, polygons=(), lines=(), road_name="", road_type="", buffer_m=15.0):
+        self.speed_limit = speed_limit    # km/h as a string, or "none"
+        self.polygons = polygons          # Lists of [lon, lat] rings (outer ring first, then holes)
+        self.lines = lines                # Lists of (lat, lon) points
+        self.road_name = road_name
+        self.road_type = road_type
+        self.buffer_m = buffer_m
+
+    def speed_kmh(self):
+        """Numeric limit in km/h, or None when unlimited."""
+        return None if self.speed_limit == "none" else float(self.speed_limit)
+
+
+class SpeedLimitMap:
+    """Speed-limit zones behind a SpatialGrid for per-tick point lookups.
+
+    Areas are indexed by polygon and roads by individual segment, so a lookup
+    only tests the few segments near the vehicle, not whole road lines.
+    """
+    def __init__(self, zones):
+        self.zones = zones
+        self.grid = SpatialGrid()
+        for zone in zones:
+            for rings in zone.polygons:
+                lons = [p[0] for p in rings[0]]
+                lats = [p[1] for p in rings[0]]
+                self.grid.insert((zone, rings), min(lats), min(lons), max(lats), max(lons))
+            pad_lat = zone.buffer_m / 111320.0
+            for line in zone.lines:
+                pad_lon = pad_lat / max(0.01, math.cos(math.radians(line[0][0])))
+                for a, b in zip(line, line[1:]):
+                    self.grid.insert((zone, (a, b)),
+                                     min(a[0], b[0]) - pad_lat, min(a[1], b[1]) - pad_lon,
+                                     max(a[0], b[0]) + pad_lat, max(a[1], b[1]) + pad_lon)
+
+    def lookup(self, lat, lon):
+        """The zone that applies at a point: the nearest matching road, else the strictest area."""
+        best_road = None
+        best_road_distance = None
+        best_area = None
+        for zone, part in self.grid.query(lat, lon):
+            if isinstance(part, tuple):
+                d, _ = point_segment_distance(lat, lon, part[0], part[1])
+                if d <= zone.buffer_m and (best_road is None or d < best_road_distance):
+                    best_road, best_road_distance = zone, d
+            elif point_in_polygon(lat, lon, part):
+                if best_area is None or (zone.speed_kmh() or math.inf) < (best_area.speed_kmh() or math.inf):
+                    best_area = zone
+        return best_road or best_area
+
+    @classmethod
+    def from_geojson(cls, path, buffer_m=15.0):
+        """Load Polygon/LineString features with an OSM-style maxspeed property."""
+        with open(path) as f:
+            data = json.load(f)
+        features = data.get("features", [data]) if data.get("type") == "FeatureCollection" or "geometry" in data else []
+
+        zones = []
+        skipped = 0
+        for feature in features:
+            properties = feature.get("properties") or {}
+            geometry = feature.get("geometry") or {}
+            speed_limit = parse_maxspeed(properties.get("maxspeed", properties.get("speed_limit")))
+            if speed_limit is None:
+                skipped += 1
+                continue
+
+            kind = geometry.get("type")
+            coordinates = geometry.get("coordinates", [])
+            polygons = []
+            lines = []
+            if kind == "Polygon":
+                polygons = [coordinates]
+            elif kind == "MultiPolygon":
+                polygons = coordinates
+            elif kind == "LineString":
+                lines = [[(p[1], p[0]) for p in coordinates]]
+            elif kind == "MultiLineString":
+                lines = [[(p[1], p[0]) for p in line] for line in coordinates]
+            else:
+                skipped += 1
+                continue
+
+            zones.append(SpeedLimitZone(
+                speed_limit, polygons, lines,
+                road_name=properties.get("name", ""),
+                road_type=properties.get("highway", properties.get("road_type", "")),
+                buffer_m=buffer_m
+            ))
+
+        if skipped:
+            print(f"Skipped {skipped} features without a usable maxspeed or geometry in {path}")
+        return cls(zones)
+
+
+def register_route_metrics(metrics):
+    """Add the get_route() outcome counts"""
+    metrics.register("simulator_route_requests_total", "counter", "Route lookups by outcome",
+                     lambda: {outcome: counter.value for outcome, counter in ROUTE_REQUESTS.items()}, "outcome")
@@ -0,0 +1,28 @@
+"""Fixed-rate scheduling for the simulation loops."""
+
+import time
+
+
+class Schedule:
+    """Slots every interval seconds that slip instead of bursting after an overrun.
+
+    clock must match the clock the caller sleeps on, e.g. loop.time for asyncio.
+    """
+    def __init__(self, interval, clock=time.monotonic):
+        self.interval = interval
+        self.clock = clock
+        self.next = clock()
+
+    def advance(self):
+        """Move to the next slot.
+
+        Returns: (seconds to sleep until it, seconds the last slot overran by)
+        """
+        self.next += self.interval
+        now = self.clock()
+        delay = self.next - now
+        if delay >= 0:
+            return delay, 0.0
+        # Overran the schedule: restart from now rather than bursting to catch up
+        self.next = now
+        return 0.0, -delay
@@ -0,0 +1,477 @@
+"""Outputs for vehicle updates: Redis, NMEA, files and memory."""
+
+import collections
+import json
+import os
+import socket
+import struct
+import threading
+import time
+from datetime import datetime, timezone
+
+
+def redis_commands_for_updates(updates, key_prefix=""):
+    """Turn (hash, fields, publish_fields) updates into HSET/PUBLISH argument lists"""
+    commands = []
+    for hash_name, fields, publish_fields in updates:
+        key = key_prefix + hash_name
+        if fields:
+            args = ["HSET", key]
+            for field, value in fields.items():
+                args += [field, value]
+            commands.append(args)
+        for field in publish_fields:
+            commands.append(["PUBLISH", key, field])
+    return commands
+
+
+class ChangeTracker:
+    """Turns snapshots of whole hashes into updates of only the fields that changed."""
+    def __init__(self):
+        self.published = {}     # Hash -> fields as last written
+        self.fields_written = 0
+
+    def updates(self, state):
+        """(hash, fields, publish_fields) for every field of state (hash -> fields) that changed since the last call"""
+        updates = []
+        for hash_name, fields in state.items():
+            previous = self.published.setdefault(hash_name, {})
+            changed = {field: value for field, value in fields.items() if previous.get(field) != value}
+            if changed:
+                previous.update(changed)
+                updates.append((hash_name, changed, list(changed)))
+                self.fields_written += len(changed)
+        return updates
+
+
+class RedisError(Exception):
+    """An error reply from Redis"""
+
+
+class RedisConnection:
+    """Minimal RESP client that runs MULTI/EXEC transactions and checks every reply.
+
+    Only what the sink needs: one pipelined transaction per call, with
+    connection problems raised as OSError and error replies as RedisError.
+    """
+    def __init__(self, host="127.0.0.1", port=6379, timeout=5.0):
+        self.address = (host, port)
+        self.timeout = timeout
+        self.socket = None
+        self.reader = None
+
+    def transaction(self, commands):
+        """Run commands in one MULTI/EXEC and return the EXEC results"""
+        if self.socket is None:
+            self.socket = socket.create_connection(self.address, timeout=self.timeout)
+            self.reader = self.socket.makefile("rb")
+        try:
+            self.socket.sendall(b"".join(self._encode(args) for args in [["MULTI"], *commands, ["EXEC"]]))
+            # MULTI and every command answer first, then EXEC with all the results
+            replies = [self._read_reply() for _ in range(len(commands) + 2)]
+        except (OSError, ValueError):
+            self.close()
+            raise
+        results = replies[-1]
+        if isinstance(results, RedisError):
+            # EXECABORT: a command was rejected while queueing, report that one
+            raise next((r for r in replies[:-1] if isinstance(r, RedisError)), results)
+        if results is None:
+            raise RedisError("transaction discarded")
+        for result in results:
+            if isinstance(result, RedisError):
+                raise result
+        return results
+
+    @staticmethod
+    def _encode(args):
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = str(arg).encode()
+            parts.append(f"${len(data)}\r\n".encode() + data + b"\r\n")
+        return b"".join(parts)
+
+    def _read_reply(self):
+        """Parse one RESP2 reply; error replies are returned rather than raised"""
+        line = self.reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("connection closed by Redis")
+        kind, payload = line[:1], line[1:-2]
+        if kind in (b"+", b":"):
+            return payload
+        if kind == b"-":
+            return RedisError(payload.decode(errors="replace"))
+        if kind == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            data = self.reader.read(length + 2)
+            if len(data) != length + 2:
+                raise ConnectionError("connection closed by Redis")
+            return data[:-2]
+        if kind == b"*":
+            count = int(payload)
+            return None if count < 0 else [self._read_reply() for _ in range(count)]
+        raise ValueError(f"unexpected Redis reply {line[:40]!r}")
+
+    def close(self):
+        if self.socket is not None:
+            self.reader.close()
+            self.socket.close()
+            self.socket = self.reader = None
+
+
+def merge_updates(older, newer):
+    """Fold two update lists into one entry per hash, newer field values winning and publishes kept"""
+    merged = {}
+    for key, fields, publish_fields in (*older, *newer):
+        merged_fields, merged_publish = merged.setdefault(key, ({}, []))
+        merged_fields.update(fields)
+        merged_publish.extend(field for field in publish_fields if field not in merged_publish)
+    return [(key, fields, publish_fields) for key, (fields, publish_fields) in merged.items()]
+
+
+class RedisSink:
+    """Streams updates into Redis over one connection from a background thread.
+
+    write() only queues the updates; building the HSET/PUBLISH commands and
+    talking to Redis happen on the writer thread, which coalesces everything
+    queued since its last write into one MULTI/EXEC and checks its replies,
+    so a refused connection or a rejected command shows up in errors rather
+    than in writes.
+
+    Simulators such as simulate-charging.py and simulate-connectivity.py only
+    write the fields that changed, so no update may be lost: when the bounded
+    queue is full the new batch is merged into the newest queued one, and a
+    batch that failed is merged back at the front and retried.
+    """
+    name = "redis"
+    retry_delay = 1.0   # Seconds between attempts while Redis is failing
+
+    def __init__(self, queue_size=100, host="127.0.0.1", port=6379):
+        self.pending = collections.deque()  # Batches of updates with the key prefix applied
+        self.queue_size = max(1, queue_size)
+        self.condition = threading.Condition()
+        self.sending = False
+        self.failing = False
+        self.closing = False
+        self.connection = RedisConnection(host, port)
+        self.batches = 0
+        self.merged = 0
+        self.dropped = 0
+        self.errors = 0
+        self.thread = threading.Thread(target=self._run, name="redis-sink", daemon=True)
+        self.thread.start()
+
+    def write(self, key_prefix, updates):
+        batch = [(key_prefix + hash_name, fields, publish_fields) for hash_name, fields, publish_fields in updates]
+        with self.condition:
+            if len(self.pending) >= self.queue_size:
+                self.pending[-1] = merge_updates(self.pending[-1], batch)
+                self.merged += 1
+            else:
+                self.pending.append(batch)
+            self.condition.notify_all()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.pending or self.closing)
+                if not self.pending:
+                    return
+                # Coalesce everything that queued up while the last write was in flight
+                batches = list(self.pending)
+                self.pending.clear()
+                self.sending = True
+
+            commands = []
+            for batch in batches:
+                commands.extend(redis_commands_for_updates(batch))
+            sent = self._send(commands)
+
+            with self.condition:
+                self.sending = False
+                self.failing = not sent
+                if not sent and self.closing:
+                    # Shutting down with Redis unavailable: give up instead of retrying forever
+                    self.dropped += len(batches) + len(self.pending)
+                    self.pending.clear()
+                elif not sent:
+                    retry = batches[0]
+                    for batch in batches[1:]:
+                        retry = merge_updates(retry, batch)
+                    if len(self.pending) >= self.queue_size:
+                        retry = merge_updates(retry, self.pending.popleft())
+                        self.merged += 1
+                    self.pending.appendleft(retry)
+                self.condition.notify_all()
+                if not sent:
+                    self.condition.wait_for(lambda: self.closing, timeout=self.retry_delay)
+
+    def _send(self, commands):
+        try:
+            self.connection.transaction(commands)
+            self.batches += 1
+            return True
+        except (OSError, ValueError, RedisError) as e:
+            if not self.errors:
+                print(f"Redis sink error: {e}")
+            self.errors += 1
+            return False
+
+    def depth(self):
+        return len(self.pending)
+
+    def flush(self):
+        """Wait until every queued update has been written to Redis, or a write has failed"""
+        with self.condition:
+            self.condition.wait_for(lambda: not (self.pending or self.sending) or self.failing)
+
+    def close(self):
+        with self.condition:
+            self.closing = True
+            self.condition.notify_all()
+        self.thread.join()
+        self.connection.close()
+
+    def stats(self):
+        return (f"redis queue {len(self.pending)}/{self.queue_size}, {self.batches} batches, "
+                f"{self.merged} merged, {self.dropped} dropped, {self.errors} errors")
+
+    def counters(self):
+        return {"writes": self.batches, "merged": self.merged, "dropped": self.dropped, "errors": self.errors}
+
+
+def nmea_sentence(body):
+    """Wrap an NMEA body in $...*checksum and CRLF"""
+    checksum = 0
+    for c in body.encode('ascii'):
+        checksum ^= c
+    return f"${body}*{checksum:02X}\r\n"
+
+
+def nmea_coordinate(value, degree_digits):
+    """Format decimal degrees as NMEA (d)ddmm.mmmm"""
+    value = abs(value)
+    degrees = int(value)
+    minutes = (value - degrees) * 60
+    return f"{degrees:0{degree_digits}d}{minutes:07.4f}"
+
+
+class NmeaSink:
+    """Emits GGA and RMC sentences for one vehicle's GPS fixes.
+
+    target is "udp:HOST:PORT", "pty" (a new pseudo-terminal whose path is
+    printed, for gpsd or a GNSS parser to open) or the path of a serial
+    device. Writes are non-blocking; a sentence pair that cannot be sent
+    right away is dropped rather than delaying the tick.
+    """
+    name = "nmea"
+
+    def __init__(self, target, key_prefix=""):
+        self.key_prefix = key_prefix
+        self.fix = {}       # Last known gps fields, since some updates only carry the speed
+        self.socket = None
+        self.address = None
+        self.fd = None
+        self.pty_slave = None
+        self.sentences = 0
+        self.dropped = 0
+
+        if target.startswith("udp:"):
+            host, _, port = target[4:].rpartition(":")
+            self.address = (host or "127.0.0.1", int(port))
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.socket.setblocking(False)
+        elif target == "pty":
+            import tty
+            self.fd, self.pty_slave = os.openpty()
+            tty.setraw(self.pty_slave)
+            os.set_blocking(self.fd, False)
+            print(f"NMEA pseudo-terminal: {os.ttyname(self.pty_slave)}")
+        else:
+            self.fd = os.open(target, os.O_WRONLY | os.O_NOCTTY | os.O_NONBLOCK)
+
+    def write(self, key_prefix, updates):
+        if key_prefix != self.key_prefix:
+            return
+        for hash_name, fields, _ in updates:
+            if hash_name == "gps":
+                self.fix.update(fields)
+                self._send(self._sentences())
+
+    def _sentences(self):
+        fix = self.fix
+        lat = float(fix.get("latitude", 0))
+        lon = float(fix.get("longitude", 0))
+        knots = float(fix.get("speed", 0)) / 1.852
+        course = float(fix.get("course", 0))
+        altitude = float(fix.get("altitude", 0))
+        now = datetime.now(timezone.utc)
+        clock = now.strftime("%H%M%S.") + f"{now.microsecond // 10000:02d}"
+        position = (f"{nmea_coordinate(lat, 2)},{'N' if lat >= 0 else 'S'},"
+                    f"{nmea_coordinate(lon, 3)},{'E' if lon >= 0 else 'W'}")
+        return (nmea_sentence(f"GPGGA,{clock},{position},1,08,0.9,{altitude:.1f},M,0.0,M,,")
+                + nmea_sentence(f"GPRMC,{clock},A,{position},{knots:.2f},{course:.1f},{now:%d%m%y},,,A"))
+
+    def _send(self, data):
+        data = data.encode('ascii')
+        try:
+            if self.socket is not None:
+                self.socket.sendto(data, self.address)
+            else:
+                os.write(self.fd, data)
+            self.sentences += 2
+        except (BlockingIOError, ConnectionRefusedError):
+            self.dropped += 2
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self.socket is not None:
+            self.socket.close()
+        if self.fd is not None:
+            os.close(self.fd)
+        if self.pty_slave is not None:
+            os.close(self.pty_slave)
+
+    def stats(self):
+        return f"nmea {self.sentences} sentences, {self.dropped} dropped"
+
+    def counters(self):
+        return {"writes": self.sentences, "dropped": self.dropped}
+
+
+class FileSink:
+    """Appends updates to a file, as JSON lines or as compact binary GPS records.
+
+    JSON lines keep every update: {"time", "key", "fields", "publish"}.
+    The binary format only keeps positions, one BINARY_RECORD per GPS
+    update: time, key prefix, latitude, longitude, speed (km/h), course
+    and altitude. Both go through a large write buffer, so the tick path
+    only formats the record.
+    """
+    name = "file"
+    BINARY_RECORD = struct.Struct("<d16sddfff")
+
+    def __init__(self, path, binary=False):
+        self.binary = binary
+        self.file = open(path, "ab" if binary else "a", buffering=1 << 20)
+        self.fixes = {}     # Key prefix -> last known gps fields, for the binary format
+        self.records = 0
+
+    def write(self, key_prefix, updates):
+        now = time.time()
+        for hash_name, fields, publish_fields in updates:
+            if not self.binary:
+                self.file.write(json.dumps({"time": round(now, 3), "key": key_prefix + hash_name,
+                                            "fields": fields, "publish": publish_fields}) + "\n")
+                self.records += 1
+            elif hash_name == "gps":
+                fix = self.fixes.setdefault(key_prefix, {})
+                fix.update(fields)
+                self.file.write(self.BINARY_RECORD.pack(
+                    now, key_prefix.encode()[:16],
+                    float(fix.get("latitude", 0)), float(fix.get("longitude", 0)),
+                    float(fix.get("speed", 0)), float(fix.get("course", 0)), float(fix.get("altitude", 0))))
+                self.records += 1
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def stats(self):
+        return f"file {self.records} records"
+
+    def counters(self):
+        return {"writes": self.records}
+
+
+class MemorySink:
+    """Keeps the latest updates in a ring buffer plus a mirror of the resulting hashes.
+
+    Meant for tests and benchmarks: records holds (time, key, fields,
+    publish_fields) for the last maxlen updates, and state maps each key
+    to its merged fields the way Redis would hold them.
+    """
+    name = "memory"
+
+    def __init__(self, maxlen=10000):
+        self.records = collections.deque(maxlen=maxlen)
+        self.state = {}
+        self.count = 0
+
+    def write(self, key_prefix, updates):
+        now = time.time()
+        for hash_name, fields, publish_fields in updates:
+            key = key_prefix + hash_name
+            self.records.append((now, key, fields, publish_fields))
+            self.state.setdefault(key, {}).update(fields)
+            self.count += 1
+
+    def get(self, key, field, default=None):
+        return self.state.get(key, {}).get(field, default)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    def stats(self):
+        return f"memory {len(self.records)}/{self.records.maxlen} buffered, {self.count} total"
+
+    def counters(self):
+        return {"writes": self.count}
+
+
+class FanOutSink:
+    """Hands every update to several sinks; each one is non-blocking, so this stays cheap."""
+    name = "fan-out"
+
+    def __init__(self, sinks):
+        self.sinks = list(sinks)
+
+    def write(self, key_prefix, updates):
+        for sink in self.sinks:
+            sink.write(key_prefix, updates)
+
+    def find(self, sink_type):
+        """First sink of the given class, or None"""
+        return next((sink for sink in self.sinks if isinstance(sink, sink_type)), None)
+
+    def flush(self):
+        for sink in self.sinks:
+            sink.flush()
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+    def stats(self):
+        return "; ".join(sink.stats() for sink in self.sinks)
+
+
+SINK_HELP = ("Output for vehicle updates, repeatable: redis, nmea:udp:HOST:PORT, nmea:pty, "
+             "nmea:DEVICE, jsonl:PATH, binary:PATH or memory[:SIZE] (default: redis)")
+
+
+def open_sinks(specs, queue_size=100):
+    """Create a FanOutSink from --sink specifications (see SINK_HELP)"""
+    sinks = []
+    for spec in specs or ["redis"]:
+        kind, _, target = spec.partition(":")
+        if kind == "redis":
+            sinks.append(RedisSink(queue_size))
+        elif kind == "nmea" and target:
+            sinks.append(NmeaSink(target))
+        elif kind in ("jsonl", "binary") and target:
+            sinks.append(FileSink(target, binary=(kind == "binary")))
+        elif kind == "memory":
+            sinks.append(MemorySink(int(target) if target else 10000))
+        else:
+            raise ValueError(f"unknown sink '{spec}'")
+    return FanOutSink(sinks)
@@ -0,0 +1,74 @@
+"""Vehicle checkpoints on disk and graceful shutdown on signals."""
+
+import json
+import os
+import signal
+import time
+
+
+def save_state(path, checkpoints):
+    """Write vehicle checkpoints (RouteFollower.checkpoint()) to path atomically.
+
+    The data is synced to a temporary file that then replaces path, so a
+    crash or power cut leaves either the previous or the new checkpoint.
+
+    Returns: True if the state was saved
+    """
+    data = json.dumps({"version": 1, "saved_at": round(time.time(), 3), "vehicles": checkpoints})
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, "w") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+        # Persist the rename itself
+        directory = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+        return True
+    except OSError as e:
+        print(f"Could not save state to {path}: {e}")
+        return False
+
+
+def load_state(path):
+    """Vehicle checkpoints saved by save_state(), or an empty list when there are none"""
+    try:
+        with open(path) as f:
+            state = json.load(f)
+        return list(state["vehicles"])
+    except FileNotFoundError:
+        return []
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        print(f"Ignoring unreadable state file {path}: {e}")
+        return []
+
+
+class ShutdownFlag:
+    """SIGINT/SIGTERM handler that asks the simulation loop to wind down.
+
+    The first signal only records its name in `requested`, so the loop can
+    bring the vehicle to a stop, flush the sinks and save its state; a
+    second one interrupts at once with KeyboardInterrupt.
+    """
+    def __init__(self):
+        self.requested = None
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, self._handle)
+
+    def _handle(self, signum, frame):
+        if self.requested:
+            raise KeyboardInterrupt
+        self.requested = signal.Signals(signum).name
+
+    def sleep(self, seconds):
+        """Sleep for up to seconds, returning early once a shutdown is requested."""
+        deadline = time.monotonic() + seconds
+        while not self.requested:
+            left = deadline - time.monotonic()
+            if left <= 0:
+                break
+            time.sleep(min(left, 0.1))
@@ -0,0 +1,718 @@
+"""Vehicle dynamics: the motor model, traffic events and the route follower."""
+
+import math
+import random
+from datetime import datetime, timedelta, timezone
+
+from .route import (Route, SpeedProfile, calculate_bearing, calculate_turn_angle, describe_turn, destination_point,
+                    haversine)
+
+class TrafficEvent:
+    """Represents a traffic event that affects speed."""
+    def __init__(self, event_type, duration, speed_limit):
+        self.type = event_type  # 'stop', 'slow', 'traffic_light'
+        self.duration = duration  # How many updates this event lasts
+        self.speed_limit = speed_limit  # Max speed during this event
+        self.remaining = duration
+
+
+def generate_traffic_event(at_intersection=False):
+    """Randomly generate a traffic event.
+
+    Args:
+        at_intersection: True if approaching a turn, increases chance of traffic light
+    """
+    rand = random.random()
+
+    # Low chance of stops at intersections (traffic lights)
+    stop_chance = 0.03 if at_intersection else 0.005
+
+    if rand < stop_chance:  # Full stop (traffic light, stop sign, pedestrian)
+        duration = random.randint(4, 12)  # 2-6 seconds at 2Hz
+        event_type = 'traffic_light' if at_intersection else 'stop'
+        return TrafficEvent(event_type, duration, 0)
+    elif rand < 0.05:  # 4.5% chance: Slow traffic (congestion, yielding)
+        duration = random.randint(6, 16)  # 3-8 seconds
+        speed_limit = random.uniform(20, 35)  # 20-35 km/h
+        return TrafficEvent('slow', duration, speed_limit)
+    elif rand < 0.10:  # 5% chance: Moderate slowdown (following another vehicle)
+        duration = random.randint(8, 24)  # 4-12 seconds
+        speed_limit = random.uniform(35, 48)  # 35-48 km/h
+        return TrafficEvent('following', duration, speed_limit)
+
+    return None
+
+
+def calculate_motor_values(current_speed, target_speed, prev_speed, voltage, min_voltage, max_continuous_current, max_peak_current, max_regen_current, motor_efficiency, controller_efficiency, peak_current_timer, update_interval, grade=0.0):
+    """Calculate realistic motor current, voltage sag, discharge, and regen values.
+
+    grade is the road slope as rise over run (0.05 = 5% uphill, negative downhill).
+
+    Returns: (motor_current, actual_voltage, battery_discharge_wh, regen_wh, new_peak_timer)
+    """
+    # Calculate required power based on speed change
+    acceleration = (current_speed - prev_speed) / update_interval if update_interval > 0 else 0
+
+    # Binary throttle model with hysteresis: either on throttle or coasting
+    # Add deadband to prevent rapid on/off cycling
+    speed_error = target_speed - current_speed
+
+    # Hysteresis: bigger deadband to prevent jagged behavior
+    # Turn throttle on when 3+ km/h below target, turn off when 1+ km/h above
+    if speed_error > 3:  # Well below target - definitely throttle on
+        throttle_on = True
+    elif speed_error < -1:  # Above target - coast
+        throttle_on = False
+    else:  # In deadband - maintain previous state (simulated with tendency to stay on)
+        # In real riding, you tend to keep throttle on in this zone
+        throttle_on = speed_error > -0.5
+
+    speed_ms = current_speed / 3.6  # Convert to m/s
+
+    # Climbing power: F_grade = m * g * sin(theta), with sin(theta) ≈ grade on road slopes
+    grade_power = 170 * 9.81 * grade * speed_ms
+
+    if not throttle_on or current_speed < 1:  # Coasting or stopped
+        motor_current = 0
+        required_elec_power = 0
+    else:
+        # Full throttle - use max power to reach/maintain target speed
+        # Realistic scooter power model
+        # Rolling resistance: F_roll = Crr * m * g (Crr ≈ 0.01 for scooter wheels)
+        rolling_power = 0.01 * 150 * 9.81 * speed_ms  # ~15W per m/s
+
+        # Air drag: F_drag = 0.5 * rho * Cd * A * v^2
+        # Cd ≈ 0.7 for upright rider, A ≈ 0.6 m^2, rho = 1.225 kg/m^3
+        drag_power = 0.5 * 1.225 * 0.7 * 0.6 * speed_ms**3  # Scales with v^3
+
+        # Base mechanical power (minimum 200W when on throttle)
+        cruise_power = max(200, rolling_power + drag_power)
+
+        # Acceleration power (realistic scooter mass ~100kg + rider 70kg = 170kg)
+        # When on throttle, provide smooth acceleration power
+        accel_power = 0
+        if speed_error > 0:  # Need to accelerate
+            # Smooth proportional control with gentler response
+            desired_accel = min(speed_error * 1.0, 10)  # Gentler proportional gain, max 10 km/h/s
+            accel_ms2 = desired_accel / 3.6  # Convert km/h/s to m/s^2
+            force = 170 * accel_ms2  # Force needed for acceleration
+            accel_power = force * speed_ms
+
+        # Total mechanical power needed (a downhill slope helps, but never drives the motor backwards)
+        total_mech_power = max(0, cruise_power + accel_power + grade_power)
+
+        # Required electrical power accounting for motor efficiency
+        required_elec_power = total_mech_power / motor_efficiency if motor_efficiency > 0 else 0
+        required_elec_power = min(required_elec_power, 3000)  # Cap at motor rating
+
+        # Calculate motor current from power: P = V * I
+        motor_current = required_elec_power / voltage if voltage > 0 else 0
+
+        # Determine if we should use peak current (only during strong acceleration)
+        new_peak_timer = max(0, peak_current_timer - update_interval)
+        if speed_error > 10 and motor_current > max_continuous_current:
+            motor_current = min(motor_current, max_peak_current)
+            new_peak_timer = 20  # 20 second peak window
+        else:
+            motor_current = min(motor_current, max_continuous_current)
+
+    # Voltage sag due to current: V_sag = V - (I * R)
+    # Estimate internal resistance as 0.01 ohm
+    internal_resistance = 0.01
+    voltage_sag = motor_current * internal_resistance
+    actual_voltage = max(min_voltage, voltage - voltage_sag)
+
+    # Battery discharge: Energy = Power * Time (only when motor is driving)
+    battery_discharge_wh = (required_elec_power * update_interval) / 3600 if required_elec_power > 0 else 0
+
+    # Regenerative braking: Only during hard braking (strong deceleration)
+    # Threshold: need at least 5 km/h/s deceleration to engage regen (threshold for brake application)
+    regen_wh = 0
+    if acceleration < -5:  # Hard braking only
+        regen_power = abs(acceleration) * 10 / 3.6 * (current_speed / 3.6)  # Estimated regen power
+        regen_power = min(regen_power, 500)  # Cap regen power at 500W
+        regen_current = regen_power / voltage if voltage > 0 else 0
+        regen_current = min(regen_current, max_regen_current)  # Cap at max regen current
+        regen_power = regen_current * voltage  # Recalculate power with capped current
+        regen_wh = (regen_power * update_interval) / 3600  # Convert to Wh
+    elif not throttle_on and grade_power < 0 and current_speed >= 1:
+        # Coasting downhill: the slope's surplus over rolling and air resistance is recuperated
+        resistance_power = 0.01 * 150 * 9.81 * speed_ms + 0.5 * 1.225 * 0.7 * 0.6 * speed_ms**3
+        surplus_power = -grade_power - resistance_power
+        if surplus_power > 0:
+            regen_power = min(surplus_power * motor_efficiency, 500)
+            regen_current = min(regen_power / voltage if voltage > 0 else 0, max_regen_current)
+            regen_wh = (regen_current * voltage * update_interval) / 3600
+
+    return motor_current, actual_voltage, battery_discharge_wh, regen_wh, peak_current_timer
+
+
+class RouteFollower:
+    """One simulated scooter following a route with realistic vehicle dynamics.
+
+    Holds the motion, motor and battery state. tick() only computes the next
+    state and the Redis hash updates for it; route fetching, Redis I/O and
+    timing are left to the caller so the same model can run in a blocking
+    loop or as one of many asyncio tasks.
+    """
+    def __init__(self, lat, lon, odometer=0.0, update_interval=1.0, publish_progress=False, speed_limits=None,
+                 elevation_model=None, deviation_probability=0.0):
+        self.lat = lat
+        self.lon = lon
+        self.update_interval = update_interval
+        self.publish_progress = publish_progress
+        self.elevation_model = elevation_model
+        self.grade = 0.0
+        self.altitude = None
+
+        self.course = 0
+        self.max_speed = 57                   # Maximum speed in km/h
+        self.max_acceleration = 11.5          # Maximum acceleration (km/h per second) - 0 to 57 km/h in ~5s
+        self.max_deceleration = 16            # Maximum deceleration (km/h per second) - gentle braking, ~3s to stop from 57 km/h
+        self.max_jerk = 8.0                   # Maximum change of acceleration (km/h per second, per second)
+        self.target_speed = self.max_speed * 0.7  # Initial target speed
+        self.acceleration = 0.0               # Current acceleration in km/h per second
+
+        # Rider style: braking planned ahead of corners, cornering grip used and cruising speed
+        self.comfort_deceleration = 10.0      # Planned braking (km/h per second), below max_deceleration
+        self.lateral_acceleration = random.uniform(1.6, 2.4)  # m/s^2 accepted in corners
+        self.cruise_speed = self.max_speed * random.uniform(0.9, 1.0)
+        self.speed_variation = 0.0            # Slowly drifting deviation from the plan in km/h
+        self.speed_profile = None
+
+        # Engine variables
+        self.current_speed = 0                # Current speed in km/h
+        self.prev_speed = 0                   # Previous speed in km/h
+
+        # Motor variables
+        self.min_voltage = 39.0               # Minimum voltage (V) - 13S LiPo cutoff (~3V/cell)
+        self.max_voltage = 54.6               # Maximum voltage (V) - 13S LiPo full (~4.2V/cell)
+        self.current_voltage = 50.4           # Current battery voltage (V) - nominal (~3.88V/cell)
+        self.battery_state = 0.8              # Battery state of charge (0.0-1.0)
+        self.battery_capacity_ah = 35.0       # Battery capacity in Ah
+        self.battery_capacity_wh = self.battery_capacity_ah * 48.0  # ~1680 Wh at nominal 48V
+        self.battery_energy_wh = self.battery_capacity_wh * self.battery_state  # Current energy in Wh
+        self.max_continuous_current = 50.0    # Max continuous current in A
+        self.max_peak_current = 80.0          # Max peak current in A (for 20s)
+        self.max_regen_current = 10.0         # Max regenerative braking current in A
+        self.motor_power_rating = 3000.0      # Motor power rating in watts
+        self.motor_efficiency = 0.85          # Motor efficiency (0.0-1.0)
+        self.controller_efficiency = 0.95     # Controller efficiency (0.0-1.0)
+        self.peak_current_timer = 0           # Timer for peak current duration
+        self.total_motor_current = 0.0        # Track motor current
+        self.total_discharge_wh = 0.0         # Track total discharge
+        self.total_regen_wh = 0.0             # Track total regen
+
+        self.odometer = odometer
+        self.rounded_odometer = round(odometer / 100) * 100
+
+        self.route_waypoints = []
+        self.waypoint_index = 0
+        self.destination = None     # (lat, lon) the current trip leads to, kept when rerouting
+
+        # Navigation progress along the route, in meters and seconds
+        self.remaining_distance = 0.0
+        self.remaining_time = 0.0
+        self.next_maneuver_distance = None
+
+        # Missed turns: chance per turn, and the straight course taken after missing one
+        self.deviation_probability = deviation_probability
+        self.deviation_course = None
+        self.deviation_distance = 0.0
+        self.off_route = False               # Set once a deviation has left the route; needs a reroute
+
+        # Speed-limit zones: a shared map plus an optional one for the current route
+        self.speed_limit_map = speed_limits
+        self.route_speed_limit_map = None
+        self.speed_limit_zone = None
+        self.published_speed_limit = None
+
+        # Traffic simulation state
+        self.current_traffic_event = None
+
+        # Last tick results, kept for status output
+        self.phase = "driving"                # 'driving', 'stopping', 'arriving' or 'arrived'
+        self.motor_current = 0.0
+        self.actual_voltage = self.current_voltage
+        self.discharge_wh = 0.0
+        self.regen_wh = 0.0
+        self.turn_angle = 0
+        self.turn_desc = "straight"
+        self.traffic_desc = "clear"
+
+    def needs_route(self):
+        """True when there is no route or the current one has been completed."""
+        return not self.route_waypoints or self.waypoint_index >= len(self.route_waypoints) - 1
+
+    def set_route(self, waypoints, speed_limits=None, destination=None):
+        """Start following a new route from its first waypoint.
+
+        destination is where the trip was routed to, by default the route's end.
+        """
+        self.route_waypoints = waypoints if isinstance(waypoints, Route) else Route.from_points(waypoints)
+        self.destination = tuple(destination) if destination else tuple(self.route_waypoints[-1])
+        if self.elevation_model is not None and self.route_waypoints.grades is None:
+            self.route_waypoints.compute_elevations(self.elevation_model)
+        self.route_speed_limit_map = speed_limits
+        self.speed_profile = SpeedProfile(
+            self.route_waypoints, self.cruise_speed, self.max_acceleration, self.comfort_deceleration,
+            self.lateral_acceleration, self.current_speed, (speed_limits, self.speed_limit_map)
+        )
+        self.waypoint_index = 0
+        self.phase = "driving"
+        self.deviation_course = None
+        self.off_route = False
+
+        # Routes usually start at the nearest road, which may be slightly behind the vehicle
+        self.snap_to_route()
+
+    def trip_destination(self):
+        """Destination of the trip in progress, to reroute to, or None once it is complete"""
+        if self.route_waypoints and self.waypoint_index >= len(self.route_waypoints) - 1:
+            return None
+        return self.destination
+
+    def snap_to_route(self):
+        """Continue from the route position nearest to the vehicle.
+
+        Returns: True if the vehicle is on the route, False if it is too far off
+        """
+        if not self.route_waypoints:
+            return False
+        snapped = self.route_waypoints.snap(self.lat, self.lon, self.waypoint_index)
+        if snapped is None:
+            return False
+        self.waypoint_index, _, _, (self.lat, self.lon) = snapped
+        return True
+
+    def _maybe_miss_turn(self):
+        """At a turn maneuver, randomly go straight on instead of following the route.
+
+        Returns: True if the rider missed the turn at the current waypoint
+        """
+        route = self.route_waypoints
+        i = self.waypoint_index
+        if self.deviation_probability <= 0 or i <= 0 or i >= len(route) - 1:
+            return False
+        if route.next_maneuver_index(i - 1) != i:
+            return False
+
+        before, at, after = route[i - 1], route[i], route[i + 1]
+        bearing_in = calculate_bearing(before[0], before[1], at[0], at[1])
+        bearing_out = calculate_bearing(at[0], at[1], after[0], after[1])
+        if calculate_turn_angle(bearing_in, bearing_out) < 30 or random.random() >= self.deviation_probability:
+            return False
+
+        self.deviation_course = bearing_in
+        self.deviation_distance = 0.0
+        return True
+
+    def relocate(self, lat, lon):
+        """Move to a new position, resuming in place when it is on the current route.
+
+        Returns: True if driving can resume on the current route, False if a new route is needed
+        """
+        self.lat = lat
+        self.lon = lon
+        if self.needs_route():
+            return False
+        return self.snap_to_route()
+
+    def checkpoint(self):
+        """Exact position, odometer, battery and route progress as JSON-compatible data"""
+        on_route = not self.needs_route() and self.deviation_course is None
+        return {
+            "lat": self.lat,
+            "lon": self.lon,
+            "course": self.course,
+            "odometer": self.odometer,
+            "battery_energy_wh": self.battery_energy_wh,
+            "total_discharge_wh": self.total_discharge_wh,
+            "total_regen_wh": self.total_regen_wh,
+            "route": self.route_waypoints.to_dict() if on_route else None,
+            "waypoint_index": self.waypoint_index if on_route else 0,
+            # Kept off the route too, so a resumed vehicle reroutes to the same place
+            "destination": list(self.trip_destination()) if self.trip_destination() else None,
+        }
+
+    def restore(self, state, route=None, speed_limits=None):
+        """Continue from a checkpoint(), on its route if it had one.
+
+        route may be passed already decoded with Route.from_dict(), e.g. to
+        fetch its per-route speed_limits first, as for set_route().
+        """
+        # Read everything first, so a checkpoint missing a field leaves the follower untouched
+        lat, lon, course = float(state["lat"]), float(state["lon"]), float(state["course"])
+        odometer = float(state["odometer"])
+        energy_wh = min(float(state["battery_energy_wh"]), self.battery_capacity_wh)
+        discharge_wh, regen_wh = float(state["total_discharge_wh"]), float(state["total_regen_wh"])
+        waypoint_index = int(state["waypoint_index"])
+        if route is None and state.get("route"):
+            route = Route.from_dict(state["route"])
+        destination = tuple(map(float, state["destination"])) if state.get("destination") else None
+
+        self.course = course
+        self.odometer = odometer
+        self.rounded_odometer = round(odometer / 100) * 100
+        self.battery_energy_wh = energy_wh
+        self.battery_state = energy_wh / self.battery_capacity_wh
+        self.current_voltage = self.min_voltage + (self.max_voltage - self.min_voltage) * self.battery_state
+        self.actual_voltage = self.current_voltage
+        self.total_discharge_wh = discharge_wh
+        self.total_regen_wh = regen_wh
+        if route is not None:
+            self.set_route(route, speed_limits, destination)
+            self.waypoint_index = min(waypoint_index, len(route) - 1)
+        else:
+            self.destination = destination
+        # set_route() snaps to the route; the checkpoint knows the exact spot
+        self.lat, self.lon = lat, lon
+
+    def _decelerate(self):
+        """Ramp speed down by one update interval of braking."""
+        self.prev_speed = self.current_speed
+        speed_delta_per_update = self.max_deceleration * self.update_interval
+        self.current_speed = max(0, self.current_speed - speed_delta_per_update)
+        self.acceleration = (self.current_speed - self.prev_speed) / self.update_interval
+
+    def stop_tick(self):
+        """Brake to a standstill while the vehicle is not ready to drive or the simulation stops.
+
+        Braking works like tick() with a target speed of 0, so the vehicle keeps
+        moving along its route and the odometer and battery keep counting; a
+        checkpoint taken once stopped has the exact position.
+
+        Returns: list of (hash, fields, publish_fields) updates, empty once stopped
+        """
+        if self.current_speed <= 0:
+            self.acceleration = 0.0
+            return []
+        self.prev_speed = self.current_speed
+        self.target_speed = 0.0
+        self._move(self._drive())
+        self.phase = "stopping"
+
+        route = self.route_waypoints
+        if self.deviation_course is not None:
+            self.course = self.deviation_course
+        elif route and self.waypoint_index < len(route) - 1:
+            p_next = route[self.waypoint_index + 1]
+            dist_to_next_wp = haversine(self.lat, self.lon, p_next[0], p_next[1])
+            if dist_to_next_wp > 0.1:
+                self.course = calculate_bearing(self.lat, self.lon, p_next[0], p_next[1])
+            self._update_progress(dist_to_next_wp)
+        return [
+            ("gps", {
+                "latitude": f"{self.lat:.6f}",
+                "longitude": f"{self.lon:.6f}",
+                "course": self.course,
+                "speed": f"{self.current_speed * 0.96:.2f}",
+            }, ["timestamp"]),
+            ("engine-ecu", {
+                "speed": int(round(self.current_speed)),
+                "odometer": int(self.rounded_odometer),
+                "motor:voltage": int(self.actual_voltage * 1000),
+                "motor:current": int(self.motor_current * 1000),
+            }, ["motor:voltage", "motor:current"]),
+            ("battery:0", {"charge": int(self.battery_state * 100)}, ["charge"]),
+        ]
+
+    def tick(self):
+        """Advance the simulation by one update interval along the current route.
+
+        Returns: list of (hash, fields, publish_fields) updates
+        """
+        update_interval = self.update_interval
+        route_waypoints = self.route_waypoints
+
+        # Store previous speed for calculating delta
+        self.prev_speed = self.current_speed
+        prev_speed = self.prev_speed
+
+        # Look up the planned speed, far enough ahead to build up braking within the jerk limit
+        i = min(self.waypoint_index, len(route_waypoints) - 2)
+        p_next = route_waypoints[i + 1]
+        distance_along = route_waypoints.cumulative_distance[i + 1] - haversine(self.lat, self.lon, p_next[0], p_next[1])
+        look_ahead = prev_speed / 3.6 * self.max_deceleration / self.max_jerk
+        profile = self.speed_profile
+        turn_based_target = min(profile.speed_at(distance_along), profile.speed_at(distance_along + look_ahead))
+        self.turn_angle = profile.turn_ahead[i]
+        self.turn_desc = describe_turn(self.turn_angle)
+
+        # Respect the legal speed limit at the current position
+        self.speed_limit_zone = self._lookup_speed_limit()
+        if self.speed_limit_zone is not None and self.speed_limit_zone.speed_kmh() is not None:
+            turn_based_target = min(turn_based_target, self.speed_limit_zone.speed_kmh())
+
+        # Detect if we're approaching an intersection (turn > 30 degrees)
+        at_intersection = self.turn_angle > 30
+
+        # Update or generate traffic events
+        if self.current_traffic_event is not None:
+            self.current_traffic_event.remaining -= 1
+            if self.current_traffic_event.remaining <= 0:
+                self.current_traffic_event = None
+        else:
+            # No active event, maybe generate a new one
+            self.current_traffic_event = generate_traffic_event(at_intersection=at_intersection)
+
+        # Apply traffic limitations
+        self.traffic_desc = "clear"
+        if self.current_traffic_event is not None:
+            turn_based_target = min(turn_based_target, self.current_traffic_event.speed_limit)
+            self.traffic_desc = self.current_traffic_event.type
+
+        # Riders drift around the plan by up to ±3 km/h over ~10s rather than jittering every tick
+        decay = math.exp(-update_interval / 10)
+        self.speed_variation = max(-3.0, min(3.0, self.speed_variation * decay
+                                             + random.gauss(0, 1.5) * math.sqrt(1 - decay * decay)))
+        self.target_speed = max(0, min(self.max_speed, turn_based_target + self.speed_variation))
+
+        distance_meters = self._drive()
+        self._move(distance_meters)
+        lat, lon = self.lat, self.lon
+
+        # Check if we've reached the destination
+        if self.waypoint_index >= len(route_waypoints) - 1:
+            if self.current_speed > 0:
+                # Ramp speed down before finishing
+                self._decelerate()
+                self.phase = "arriving"
+                return [
+                    ("gps", {
+                        "latitude": f"{lat:.6f}",
+                        "longitude": f"{lon:.6f}",
+                        "course": self.course,
+                        "speed": f"{self.current_speed * 0.96:.2f}",
+                    }, ["timestamp"]),
+                    ("engine-ecu", {"speed": int(round(self.current_speed))}, []),
+                ]
+            self.phase = "arrived"
+            return []
+
+        self.phase = "driving"
+
+        # Calculate course from current position to next waypoint
+        p_next = route_waypoints[self.waypoint_index + 1]
+
+        # Only update course if we are actually moving
+        dist_to_next_wp = haversine(lat, lon, p_next[0], p_next[1])
+        if self.deviation_course is not None:
+            self.course = self.deviation_course
+        elif dist_to_next_wp > 0.1:
+            self.course = calculate_bearing(lat, lon, p_next[0], p_next[1])
+
+        self._update_progress(dist_to_next_wp)
+        gps_fields = {
+            "latitude": f"{lat:.6f}",
+            "longitude": f"{lon:.6f}",
+            "course": self.course,
+            "speed": f"{self.current_speed * 0.96:.2f}",
+        }
+        elevations = route_waypoints.elevations
+        if elevations:
+            # Interpolate along the current segment
+            i = self.waypoint_index
+            segment_length = route_waypoints.cumulative_distance[i + 1] - route_waypoints.cumulative_distance[i]
+            fraction = 1 - dist_to_next_wp / segment_length if segment_length > 0 else 1
+            self.altitude = elevations[i] + (elevations[i + 1] - elevations[i]) * max(0.0, min(1.0, fraction))
+            gps_fields["altitude"] = f"{self.altitude:.1f}"
+
+        # Convert voltage to mV and current to mA for Redis
+        updates = [
+            ("gps", gps_fields, ["timestamp"]),
+            ("engine-ecu", {
+                "speed": int(round(self.current_speed)),
+                "odometer": int(self.rounded_odometer),
+                "motor:voltage": int(self.actual_voltage * 1000),
+                "motor:current": int(self.motor_current * 1000),
+            }, ["motor:voltage", "motor:current"]),
+            ("battery:0", {"charge": int(self.battery_state * 100)}, ["charge"]),
+        ]
+        if self.publish_progress:
+            eta = datetime.now(timezone.utc) + timedelta(seconds=self.remaining_time)
+            progress = {
+                "remaining-distance": int(self.remaining_distance),
+                "remaining-time": int(self.remaining_time),
+                "eta": eta.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            }
+            if self.next_maneuver_distance is not None:
+                progress["next-maneuver-distance"] = int(self.next_maneuver_distance)
+            updates.append(("navigation", progress, ["remaining-distance"]))
+        speed_limit_update = self._speed_limit_update()
+        if speed_limit_update:
+            updates.append(speed_limit_update)
+        return updates
+
+    def _drive(self):
+        """Approach target_speed for one update interval and account for the energy and distance.
+
+        Returns: meters travelled
+        """
+        # Approach the target with limited acceleration and jerk, easing off so it is not overshot
+        update_interval = self.update_interval
+        prev_speed = self.prev_speed
+        speed_error = self.target_speed - prev_speed
+        desired = math.copysign(min(abs(speed_error) / update_interval, math.sqrt(2 * self.max_jerk * abs(speed_error))),
+                                speed_error)
+        desired = max(-self.max_deceleration, min(self.max_acceleration, desired))
+        jerk_step = self.max_jerk * update_interval
+        self.acceleration = max(self.acceleration - jerk_step, min(self.acceleration + jerk_step, desired))
+        self.current_speed = max(0.0, prev_speed + self.acceleration * update_interval)
+
+        # Road slope of the current segment (flat without an elevation model)
+        grades = self.route_waypoints.grades if self.route_waypoints else None
+        self.grade = grades[self.waypoint_index] if grades and self.waypoint_index < len(grades) else 0.0
+
+        # Calculate motor values (current, voltage, discharge, regen)
+        (self.motor_current, self.actual_voltage, self.discharge_wh, self.regen_wh,
+         self.peak_current_timer) = calculate_motor_values(
+            self.current_speed, self.target_speed, prev_speed, self.current_voltage, self.min_voltage,
+            self.max_continuous_current, self.max_peak_current, self.max_regen_current,
+            self.motor_efficiency, self.controller_efficiency,
+            self.peak_current_timer, update_interval, self.grade
+        )
+
+        # Update battery energy and voltage based on discharge/regen
+        self.battery_energy_wh -= self.discharge_wh
+        self.battery_energy_wh = min(self.battery_energy_wh + self.regen_wh, self.battery_capacity_wh)
+        self.battery_state = self.battery_energy_wh / self.battery_capacity_wh if self.battery_capacity_wh > 0 else 0.0
+
+        # Update current voltage based on state of charge (linear approximation)
+        # Voltage ranges from 48V (0% SoC) to 57V (100% SoC)
+        self.current_voltage = self.min_voltage + (self.max_voltage - self.min_voltage) * self.battery_state
+
+        # Track cumulative metrics
+        self.total_motor_current += self.motor_current
+        self.total_discharge_wh += self.discharge_wh
+        self.total_regen_wh += self.regen_wh
+
+        # Calculate distance traveled in this update interval (km)
+        distance_km = (self.current_speed / 3600) * update_interval
+        distance_meters = distance_km * 1000
+        self.odometer += distance_meters
+        self.rounded_odometer = round(self.odometer / 100) * 100
+        return distance_meters
+
+    def _move(self, distance_to_travel):
+        """Advance distance_to_travel meters along the route, or straight ahead when off or without one."""
+        route_waypoints = self.route_waypoints
+        lat, lon = self.lat, self.lon
+        while (distance_to_travel > 0 and self.deviation_course is None and route_waypoints
+               and self.waypoint_index < len(route_waypoints) - 1):
+            p_next = route_waypoints[self.waypoint_index + 1]
+            dist_to_next_wp = haversine(lat, lon, p_next[0], p_next[1])
+
+            # If we are very close to the next waypoint, just snap to it
+            if dist_to_next_wp < 0.1:
+                self.waypoint_index += 1
+                continue
+
+            if distance_to_travel >= dist_to_next_wp:
+                distance_to_travel -= dist_to_next_wp
+                lat, lon = p_next
+                self.waypoint_index += 1
+                self._maybe_miss_turn()
+            else:
+                # Interpolate between current position and the next waypoint
+                ratio = distance_to_travel / dist_to_next_wp
+                lat = lat + (p_next[0] - lat) * ratio
+                lon = lon + (p_next[1] - lon) * ratio
+                distance_to_travel = 0
+
+        # After a missed turn, keep going straight until clearly off the route
+        if self.deviation_course is not None and distance_to_travel > 0:
+            lat, lon = destination_point(lat, lon, self.deviation_course, distance_to_travel)
+            self.deviation_distance += distance_to_travel
+            if self.deviation_distance > 300 or route_waypoints.snap(lat, lon, self.waypoint_index) is None:
+                self.off_route = True
+        elif not route_waypoints and distance_to_travel > 0:
+            # No route to follow: carry on along the current course
+            lat, lon = destination_point(lat, lon, self.course, distance_to_travel)
+        self.lat, self.lon = lat, lon
+
+    def _lookup_speed_limit(self):
+        for speed_limit_map in (self.route_speed_limit_map, self.speed_limit_map):
+            if speed_limit_map is not None:
+                zone = speed_limit_map.lookup(self.lat, self.lon)
+                if zone is not None:
+                    return zone
+        return None
+
+    def _speed_limit_update(self):
+        """speed-limit hash update when the applicable zone changed, else None."""
+        if self.speed_limit_map is None and self.route_speed_limit_map is None:
+            return None
+        zone = self.speed_limit_zone
+        fields = {
+            "speed-limit": zone.speed_limit if zone else "unknown",
+            "road-name": zone.road_name if zone else "",
+            "road-type": zone.road_type if zone else "",
+        }
+        if fields == self.published_speed_limit:
+            return None
+        self.published_speed_limit = fields
+        return ("speed-limit", fields, ["speed-limit"])
+
+    def _update_progress(self, dist_to_next_wp):
+        """Update remaining distance, time and next maneuver distance from the cumulative distances."""
+        route = self.route_waypoints
+        distance_at_next_wp = route.cumulative_distance[self.waypoint_index + 1]
+        self.remaining_distance = route.length - distance_at_next_wp + dist_to_next_wp
+
+        maneuver_index = route.next_maneuver_index(self.waypoint_index)
+        if maneuver_index is None:
+            self.next_maneuver_distance = None
+        else:
+            self.next_maneuver_distance = route.cumulative_distance[maneuver_index] - distance_at_next_wp + dist_to_next_wp
+
+        # Scale the backend's estimate when known, otherwise assume a city average of 25 km/h
+        if route.duration and route.length > 0:
+            self.remaining_time = route.duration * self.remaining_distance / route.length
+        else:
+            self.remaining_time = self.remaining_distance / (25 / 3.6)
+
+    def status_lines(self):
+        """Human-readable summary of the last tick."""
+        engine_speed = int(round(self.current_speed))
+        if self.phase == "stopping":
+            return [f"Decelerating to stop: {engine_speed} km/h"]
+        if self.phase == "arriving":
+            return [f"Arriving at destination, decelerating: {engine_speed} km/h"]
+        if self.phase == "arrived":
+            return [
+                "Destination reached!",
+                f"Final position: lat={self.lat:.6f}, lon={self.lon:.6f}",
+                f"Final odometer: {int(self.rounded_odometer)}m",
+            ]
+        return [
+            f"GPS: lat={self.lat:.6f}, lon={self.lon:.6f}, course={self.course:.1f}°",
+            f"Engine: speed={engine_speed}km/h (target: {int(round(self.target_speed))}km/h)",
+            f"Motor: current={self.motor_current:.1f}A, voltage={self.actual_voltage:.1f}V, SoC={self.battery_state*100:.1f}%",
+            f"Energy: discharge={self.discharge_wh:.2f}Wh, regen={self.regen_wh:.2f}Wh (cumulative: -{self.total_discharge_wh:.1f}Wh, +{self.total_regen_wh:.1f}Wh)",
+            f"Road: {self.turn_desc} ahead (turn angle: {self.turn_angle:.1f}°), grade {self.grade * 100:+.1f}%"
+            + (f", altitude {self.altitude:.0f}m" if self.altitude is not None else ""),
+            self._route_status(),
+            f"Traffic: {self.traffic_desc}",
+            f"Speed limit: {self._format_speed_limit()}",
+            f"Odometer: {int(self.rounded_odometer)}m",
+        ]
+
+    def _route_status(self):
+        if self.off_route:
+            return f"Route: OFF ROUTE after missing a turn ({int(self.deviation_distance)}m), waiting for reroute"
+        if self.deviation_course is not None:
+            return f"Route: missed turn, {int(self.deviation_distance)}m past it"
+        return (f"Route: {self.remaining_distance / 1000:.2f}km remaining, ~{int(self.remaining_time / 60)}min, "
+                f"next maneuver in {self._format_distance(self.next_maneuver_distance)}")
+
+    def _format_speed_limit(self):
+        zone = self.speed_limit_zone
+        if zone is None:
+            return "unknown"
+        limit = "none" if zone.speed_limit == "none" else f"{zone.speed_limit} km/h"
+        return f"{limit} ({zone.road_name})" if zone.road_name else limit
+
+    @staticmethod
+    def _format_distance(distance):
+        return "-" if distance is None else f"{int(distance)}m"
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+# /// script
+# requires-python = ">=3.11"
+# dependencies = []
+# ///
+
+import argparse
+import math
+import time
+
+from scootsim.sinks import SINK_HELP, ChangeTracker, open_sinks
+
+
+# Open-circuit cell voltage (V) by state of charge (%), for the 13S main and the single-cell CB battery
+CELL_OCV = [(0, 3.0), (10, 3.45), (20, 3.55), (40, 3.65), (60, 3.8), (80, 3.95), (90, 4.05), (100, 4.2)]
+
+# Vehicle state published for each mode
+VEHICLE_STATES = {
+    "charge": "stand-by",
+    "standby": "stand-by",
+    "hibernate": "hibernating",
+}
+
+
+def interpolate(table, x):
+    """Linear interpolation in a sorted list of (x, y) points, clamped at both ends"""
+    if x <= table[0][0]:
+        return table[0][1]
+    for (x0, y0), (x1, y1) in zip(table, table[1:]):
+        if x <= x1:
+            return y0 + (y1 - y0) * (x - x0) / (x1 - x0)
+    return table[-1][1]
+
+
+def approach(value, target, dt, time_constant):
+    """First-order lag of value towards target over dt seconds"""
+    return target + (value - target) * math.exp(-dt / time_constant)
+
+
+class MainBattery:
+    """13S Li-ion main battery, charged with constant current and then constant voltage.
+
+    Charging current is positive. During CC the terminal voltage (open
+    circuit voltage plus the drop over the internal resistance) rises until
+    it reaches the CV limit; from then on the current tapers so the
+    terminal voltage stays there, until it falls below the cutoff.
+    """
+    cells = 13
+
+    def __init__(self, charge, capacity_ah=35.0, resistance=0.15, ambient=22.0):
+        self.soc = charge / 100
+        self.capacity_ah = capacity_ah
+        self.resistance = resistance
+        self.ambient = ambient
+        self.temperature = ambient
+        self.current = 0.0
+        self.phase = "idle"     # 'cc', 'cv', 'done' or 'idle'
+
+    def open_circuit_voltage(self):
+        return self.cells * interpolate(CELL_OCV, self.soc * 100)
+
+    def voltage(self):
+        return self.open_circuit_voltage() + self.current * self.resistance
+
+    def charge(self, dt, cc_current, cv_voltage, cutoff_current):
+        """Advance a CC/CV charge by dt seconds"""
+        current = min(cc_current, (cv_voltage - self.open_circuit_voltage()) / self.resistance)
+        if current < cutoff_current or self.soc >= 1.0:
+            self.current = 0.0
+            self.phase = "done"
+        else:
+            self.current = current
+            self.phase = "cc" if current >= cc_current else "cv"
+            self.soc = min(1.0, self.soc + current * dt / 3600 / self.capacity_ah)
+        self._heat(dt)
+
+    def drain(self, dt, current):
+        """Discharge with a constant current (A) for dt seconds"""
+        self.current = -current if current else 0.0
+        self.phase = "idle"
+        self.soc = max(0.0, self.soc - current * dt / 3600 / self.capacity_ah)
+        self._heat(dt)
+
+    def _heat(self, dt):
+        # Warms up by ~0.4°C per ampere of charge current, with a 20 minute time constant
+        self.temperature = approach(self.temperature, self.ambient + 0.4 * abs(self.current), dt, 1200)
+
+
+class AuxBattery:
+    """12V lead-acid aux battery, charged in bulk, absorption and float stages by the DC-DC converter."""
+    def __init__(self, charge, capacity_ah=5.0, bulk_current=1.0):
+        self.soc = charge / 100
+        self.capacity_ah = capacity_ah
+        self.bulk_current = bulk_current
+        self.voltage = 12.7
+        self.charge_status = "not-charging"
+
+    def step(self, dt, charging, drain_current):
+        if charging:
+            if self.soc < 0.8:
+                self.charge_status = "bulk-charge"
+                current = self.bulk_current
+                self.voltage = 12.8 + 1.6 * self.soc / 0.8
+            elif self.soc < 1.0:
+                # Absorption holds 14.4V while the current tapers off
+                self.charge_status = "absorption-charge"
+                current = max(0.05, self.bulk_current * (1.0 - self.soc) / 0.2)
+                self.voltage = 14.4
+            else:
+                self.charge_status = "float-charge"
+                current = 0.0
+                self.voltage = 13.6
+            self.soc = min(1.0, self.soc + current * dt / 3600 / self.capacity_ah)
+        else:
+            self.charge_status = "not-charging"
+            self.soc = max(0.0, self.soc - drain_current * dt / 3600 / self.capacity_ah)
+            # Resting voltage of a 12V lead-acid battery, ~11.6V empty to 12.7V full
+            self.voltage = 11.6 + 1.1 * self.soc
+
+
+class CbBattery:
+    """Single-cell Li-ion connectivity battery, charged from the main battery."""
+    def __init__(self, charge, capacity_mah=2000.0, charge_current=500.0, ambient=22.0):
+        self.soc = charge / 100
+        self.capacity_mah = capacity_mah
+        self.charge_current = charge_current
+        self.temperature = ambient
+        self.current = 0.0
+        self.charge_status = "not-charging"
+        self.full = False       # Charging stopped at 100% and resumes below 95%
+
+    def step(self, dt, charging, drain_current):
+        if self.soc >= 1.0:
+            self.full = True
+        elif self.soc < 0.95:
+            self.full = False
+
+        if charging and not self.full:
+            self.charge_status = "charging"
+            # Constant current up to 90%, then tapering
+            self.current = self.charge_current if self.soc < 0.9 else max(20.0, self.charge_current * (1.0 - self.soc) / 0.1)
+        elif charging:
+            # Full: the main battery carries the load
+            self.charge_status = "not-charging"
+            self.current = 0.0
+        else:
+            self.charge_status = "not-charging"
+            self.current = -drain_current
+        self.soc = max(0.0, min(1.0, self.soc + self.current * dt / 3600 / self.capacity_mah))
+
+    def fields(self):
+        remaining = self.soc * self.capacity_mah
+        if self.current > 0:
+            time_to_full, time_to_empty = int((self.capacity_mah - remaining) / self.current * 3600), 0
+        elif self.current < 0:
+            time_to_full, time_to_empty = 0, int(remaining / -self.current * 3600)
+        else:
+            time_to_full, time_to_empty = 0, 0
+        return {
+            "present": "true",
+            "charge": round(self.soc * 100),
+            "current": int(self.current),
+            "remaining-capacity": int(remaining),
+            "full-capacity": int(self.capacity_mah),
+            "cell-voltage": int(interpolate(CELL_OCV, self.soc * 100) * 1000),
+            "temperature": round(self.temperature),
+            "time-to-full": time_to_full,
+            "time-to-empty": time_to_empty,
+            "charge-status": self.charge_status,
+        }
+
+
+class Session:
+    """One charging, standby or hibernation session of a parked scooter."""
+    def __init__(self, mode, args):
+        self.mode = mode
+        self.args = args
+        self.main = MainBattery(args.main_charge)
+        self.aux = AuxBattery(args.aux_charge)
+        self.cb = CbBattery(args.cb_charge)
+        self.elapsed = 0.0
+        self.changes = ChangeTracker()    # Publishes changed fields only
+
+    def step(self, dt):
+        """Advance the simulation by dt seconds, in steps short enough for the CV taper"""
+        args = self.args
+        while dt > 0:
+            step = min(dt, 10.0)
+            dt -= step
+            self.elapsed += step
+            if self.mode == "charge":
+                self.main.charge(step, args.charge_current, args.cv_voltage, args.cutoff_current)
+            elif self.mode == "standby":
+                self.main.drain(step, args.standby_current)
+            else:
+                # Hibernating: the main battery is asleep and the aux and CB batteries are on their own
+                self.main.drain(step, 0.0)
+            main_powered = self.mode != "hibernate" and self.main.soc > 0
+            self.aux.step(step, main_powered, args.aux_drain)
+            self.cb.step(step, main_powered, args.cb_drain)
+
+    def finished(self):
+        if self.mode == "charge":
+            return self.main.phase == "done"
+        return self.elapsed >= self.args.duration * 3600
+
+    def updates(self):
+        """(hash, fields, publish_fields) for every field that changed since the last call"""
+        main = self.main
+        if self.mode == "hibernate":
+            main_state = "asleep"
+        else:
+            main_state = "active" if main.current > 0 else "idle"
+        temperature = round(main.temperature)
+        state = {
+            "vehicle": {"state": VEHICLE_STATES[self.mode]},
+            "battery:0": {
+                "present": "true",
+                "state": main_state,
+                "charge": round(main.soc * 100),
+                "voltage": int(main.voltage() * 1000),
+                "current": int(main.current * 1000),
+                "temperature:0": temperature,
+                "temperature:1": temperature,
+                "temperature:2": temperature + 1,
+                "temperature:3": temperature + 1,
+            },
+            "aux-battery": {
+                "charge": round(self.aux.soc * 100),
+                "voltage": int(self.aux.voltage * 1000),
+                "charge-status": self.aux.charge_status,
+            },
+            "cb-battery": self.cb.fields(),
+        }
+        return self.changes.updates(state)
+
+    def status_line(self):
+        hours, minutes = divmod(int(self.elapsed // 60), 60)
+        main = self.main
+        return (f"{hours:3d}h{minutes:02d}m {VEHICLE_STATES[self.mode]} | "
+                f"main {main.soc * 100:5.1f}% {main.voltage():.2f}V {main.current:+.2f}A {main.phase} "
+                f"{main.temperature:.1f}°C | aux {self.aux.soc * 100:5.1f}% {self.aux.voltage:.2f}V "
+                f"{self.aux.charge_status} | cb {self.cb.soc * 100:5.1f}% {self.cb.current:+.0f}mA {self.cb.charge_status}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Simulate charging, standby and hibernation battery behaviour at accelerated time'
+    )
+    parser.add_argument('mode', choices=list(VEHICLE_STATES),
+                        help='charge: CC/CV charge of the main battery; standby: slow main drain; '
+                             'hibernate: aux and CB battery drain')
+    parser.add_argument('--speedup', type=float, default=600.0,
+                        help='Simulated seconds per real second (default: 600)')
+    parser.add_argument('--rate', type=float, default=2.0,
+                        help='Updates per real second (default: 2)')
+    parser.add_argument('--duration', type=float, default=72.0,
+                        help='Simulated hours for standby and hibernate (default: 72)')
+    parser.add_argument('--main-charge', type=float,
+                        help='Initial main battery charge in %% (default: 20 for charge, 80 otherwise)')
+    parser.add_argument('--aux-charge', type=float, default=70.0,
+                        help='Initial aux battery charge in %% (default: 70)')
+    parser.add_argument('--cb-charge', type=float, default=60.0,
+                        help='Initial CB battery charge in %% (default: 60)')
+    parser.add_argument('--charge-current', type=float, default=7.0,
+                        help='Charger constant current in A (default: 7)')
+    parser.add_argument('--cv-voltage', type=float, default=54.6,
+                        help='Charger constant voltage in V (default: 54.6)')
+    parser.add_argument('--cutoff-current', type=float, default=0.5,
+                        help='Charge ends when the CV current falls below this, in A (default: 0.5)')
+    parser.add_argument('--standby-current', type=float, default=0.03,
+                        help='Main battery drain in standby, in A (default: 0.03)')
+    parser.add_argument('--aux-drain', type=float, default=0.015,
+                        help='Aux battery drain while hibernating, in A (default: 0.015)')
+    parser.add_argument('--cb-drain', type=float, default=10.0,
+                        help='CB battery drain while not charging, in mA (default: 10)')
+    parser.add_argument('--key-prefix', default='',
+                        help='Prefix for the Redis keys, e.g. sim:1: for a fleet vehicle (default: none)')
+    parser.add_argument('--sink', action='append', metavar='SPEC', help=SINK_HELP)
+    args = parser.parse_args()
+
+    if args.speedup <= 0 or args.rate <= 0:
+        parser.error('--speedup and --rate must be positive')
+    if args.main_charge is None:
+        args.main_charge = 20.0 if args.mode == "charge" else 80.0
+    try:
+        sink = open_sinks(args.sink)
+    except (ValueError, OSError) as e:
+        parser.error(f"--sink: {e}")
+
+    session = Session(args.mode, args)
+    interval = 1.0 / args.rate
+    print(f"Simulating {args.mode} at {args.speedup:g}x ({args.speedup * interval / 60:.1f} simulated minutes per update)")
+    print("Press Ctrl+C to stop")
+
+    try:
+        while True:
+            sink.write(args.key_prefix, session.updates())
+            print(session.status_line())
+            if session.finished():
+                break
+            time.sleep(interval)
+            session.step(args.speedup * interval)
+        print(f"Session finished after {session.elapsed / 3600:.1f} simulated hours")
+    except KeyboardInterrupt:
+        print("\nSimulation stopped")
+    finally:
+        sink.flush()
+        sink.close()
+
+
+if __name__ == "__main__":
+    main()
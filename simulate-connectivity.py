@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+# /// script
+# requires-python = ">=3.11"
+# dependencies = []
+# ///
+
+import argparse
+import math
+import random
+import time
+
+from scootsim.sinks import SINK_HELP, ChangeTracker, open_sinks
+
+
+# Sustained download throughput at full signal, in bytes per second
+ACCESS_TECH_THROUGHPUT = {"5G": 20e6, "LTE": 5e6, "UMTS": 800e3, "GSM": 25e3}
+
+# Lowest signal quality in % at which the modem uses each access technology
+ACCESS_TECH_SIGNAL = [("5G", 85), ("LTE", 35), ("UMTS", 15), ("GSM", 0)]
+
+# Update image size in bytes and install/reboot time in seconds per component
+OTA_COMPONENTS = {
+    "mdb": {"size": 180e6, "install_time": 240.0, "reboot_time": 60.0},
+    "dbc": {"size": 120e6, "install_time": 150.0, "reboot_time": 30.0},
+}
+
+OTA_ERRORS = [
+    ("download-failed", "Download interrupted: connection reset by peer"),
+    ("checksum-mismatch", "Downloaded image failed signature verification"),
+    ("install-failed", "Could not write the update to the inactive partition"),
+]
+
+
+def exponential(mean):
+    return random.expovariate(1.0 / mean) if mean > 0 else math.inf
+
+
+class OtaUpdate:
+    """Download, install and reboot cycle of one component (mdb or dbc)."""
+    def __init__(self, component, interval, failure_probability):
+        self.component = component
+        self.spec = OTA_COMPONENTS[component]
+        self.interval = interval
+        self.failure_probability = failure_probability
+        self.status = "idle"
+        self.version = ""
+        self.error = ""
+        self.error_message = ""
+        self.downloaded = 0.0
+        self.install_progress = 0.0
+        self.timer = exponential(interval)
+        self.fail_at = None
+        self.updates = 0
+
+    def step(self, dt, throughput):
+        """Advance by dt simulated seconds with the given download throughput in bytes/s"""
+        self.timer -= dt
+        if self.status == "idle":
+            if self.timer <= 0:
+                self.updates += 1
+                self.version = f"v1.{random.randint(0, 20)}.{self.updates}"
+                self.error = self.error_message = ""
+                self.downloaded = 0.0
+                self.install_progress = 0.0
+                # Decide up front whether this update fails, and where: the first half
+                # of fail_at covers the download, the second half the install
+                self.fail_at = random.random() if random.random() < self.failure_probability else None
+                self.status = "downloading"
+        elif self.status == "downloading":
+            self.downloaded = min(self.spec["size"], self.downloaded + throughput * dt)
+            if self.fail_at is not None and self.fail_at < 0.5 and self.progress() >= self.fail_at * 200:
+                self.fail(*OTA_ERRORS[0 if throughput == 0 or random.random() < 0.5 else 1])
+            elif self.downloaded >= self.spec["size"]:
+                self.status = "installing"
+        elif self.status == "installing":
+            self.install_progress = min(1.0, self.install_progress + dt / self.spec["install_time"])
+            if self.fail_at is not None and self.install_progress >= (self.fail_at - 0.5) * 2:
+                self.fail(*OTA_ERRORS[2])
+            elif self.install_progress >= 1.0:
+                self.status = "rebooting"
+                self.timer = self.spec["reboot_time"]
+        elif self.timer <= 0:
+            # Rebooting or error: back to idle until the next update
+            self.status = "idle"
+            self.version = ""
+            self.downloaded = 0.0
+            self.install_progress = 0.0
+            self.timer = exponential(self.interval)
+
+    def fail(self, error, message):
+        self.status = "error"
+        self.error, self.error_message = error, message
+        self.fail_at = None
+        self.timer = 60.0
+
+    def progress(self):
+        return int(self.downloaded / self.spec["size"] * 100)
+
+    def fields(self):
+        c = self.component
+        return {
+            f"status:{c}": self.status,
+            f"update-version:{c}": self.version,
+            f"update-method:{c}": "full" if self.version else "",
+            f"download-progress:{c}": self.progress(),
+            f"install-progress:{c}": int(self.install_progress * 100),
+            f"error:{c}": self.error,
+            f"error-message:{c}": self.error_message,
+        }
+
+
+class Modem:
+    """Cellular modem with a wandering signal, technology changes and dropouts.
+
+    Signal quality follows a mean-reverting random walk; falling below 5%
+    or a random dropout disconnects the modem until it re-registers, and the
+    cloud connection follows a few seconds after the data connection.
+    """
+    def __init__(self, signal, volatility, dropout_interval):
+        self.mean_signal = signal
+        self.signal = signal
+        self.volatility = volatility
+        self.dropout_interval = dropout_interval
+        self.modem_state = "connected"
+        self.cloud = "connected"
+        self.access_tech = self.select_access_tech("")
+        self.ip_address = self.new_ip_address()
+        self.reconnect_timer = 0.0
+        self.cloud_timer = 0.0
+        self.dropouts = 0
+
+    @staticmethod
+    def new_ip_address():
+        return f"10.{random.randint(0, 255)}.{random.randint(0, 255)}.{random.randint(1, 254)}"
+
+    def select_access_tech(self, current):
+        """Technology for the current signal, with 5 points of hysteresis against flapping"""
+        for tech, threshold in ACCESS_TECH_SIGNAL:
+            if self.signal >= threshold + (0 if tech == current else 5):
+                return tech
+            if tech == current and self.signal >= threshold - 5:
+                return tech
+        return "GSM"
+
+    def step(self, dt):
+        # Mean-reverting walk with a 60 s time constant
+        noise = random.gauss(0.0, self.volatility * math.sqrt(dt))
+        self.signal += (self.mean_signal - self.signal) * min(1.0, dt / 60.0) + noise
+        self.signal = max(0.0, min(100.0, self.signal))
+
+        if self.modem_state == "connected":
+            if self.signal < 5 or random.random() < dt / self.dropout_interval:
+                self.modem_state = "disconnected"
+                self.cloud = "disconnected"
+                self.ip_address = ""
+                self.reconnect_timer = random.uniform(10.0, 60.0)
+                self.dropouts += 1
+            else:
+                self.access_tech = self.select_access_tech(self.access_tech)
+                if self.cloud == "disconnected":
+                    self.cloud_timer -= dt
+                    if self.cloud_timer <= 0:
+                        self.cloud = "connected"
+        else:
+            self.reconnect_timer -= dt
+            if self.reconnect_timer <= 0 and self.signal >= 10:
+                self.modem_state = "connected"
+                self.access_tech = self.select_access_tech("")
+                self.ip_address = self.new_ip_address()
+                self.cloud_timer = random.uniform(2.0, 10.0)
+
+    def throughput(self):
+        if self.modem_state != "connected":
+            return 0.0
+        return ACCESS_TECH_THROUGHPUT[self.access_tech] * self.signal / 100
+
+    def fields(self):
+        connected = self.modem_state == "connected"
+        return {
+            "modem-state": self.modem_state,
+            "status": "connected" if connected else "disconnected",
+            "unu-cloud": self.cloud,
+            "ip-address": self.ip_address,
+            "access-tech": self.access_tech if connected else "",
+            "signal-quality": round(self.signal) if connected else 0,
+            "sim-imei": "350000000000017",
+            "sim-imsi": "262010000000017",
+            "sim-iccid": "89490200000000000017",
+        }
+
+
+class Ble:
+    """Phone connecting to and disconnecting from the scooter over BLE."""
+    def __init__(self, connected_time, disconnected_time):
+        self.connected_time = connected_time
+        self.disconnected_time = disconnected_time
+        self.status = "disconnected"
+        self.timer = exponential(disconnected_time)
+        self.connections = 0
+
+    def step(self, dt):
+        self.timer -= dt
+        if self.timer > 0:
+            return
+        if self.status == "connected":
+            self.status = "disconnected"
+            self.timer = exponential(self.disconnected_time)
+        else:
+            self.status = "connected"
+            self.connections += 1
+            self.timer = exponential(self.connected_time)
+
+    def fields(self):
+        return {
+            "status": self.status,
+            "mac-address": "C0:FF:EE:00:00:17",
+            "pin-code": "",
+            "service-health": "ok",
+            "service-error": "",
+            # Heartbeat in wall-clock seconds: the UI shows a BLE error once it is 30 s stale
+            "last-update": str(int(time.time()) // 5 * 5),
+        }
+
+
+class Session:
+    """OTA, modem and BLE state of one scooter, advanced in simulated time."""
+    def __init__(self, args):
+        self.ota = [OtaUpdate(component, args.ota_interval, args.ota_failure_rate)
+                    for component in args.ota_components]
+        self.modem = Modem(args.signal, args.signal_volatility, args.dropout_interval)
+        self.ble = Ble(args.ble_connected, args.ble_disconnected)
+        self.scenarios = args.scenario
+        self.elapsed = 0.0
+        self.changes = ChangeTracker()    # Publishes changed fields only
+
+    def step(self, dt):
+        """Advance by dt simulated seconds, in steps short enough for the progress bars"""
+        while dt > 0:
+            step = min(dt, 1.0)
+            dt -= step
+            self.elapsed += step
+            if "modem" in self.scenarios:
+                self.modem.step(step)
+            if "ota" in self.scenarios:
+                throughput = self.modem.throughput() if "modem" in self.scenarios else ACCESS_TECH_THROUGHPUT["LTE"]
+                for update in self.ota:
+                    update.step(step, throughput)
+            if "ble" in self.scenarios:
+                self.ble.step(step)
+
+    def updates(self):
+        """(hash, fields, publish_fields) for every field that changed since the last call"""
+        state = {}
+        if "ota" in self.scenarios:
+            state["ota"] = {}
+            for update in self.ota:
+                state["ota"].update(update.fields())
+        if "modem" in self.scenarios:
+            state["internet"] = self.modem.fields()
+        if "ble" in self.scenarios:
+            state["ble"] = self.ble.fields()
+        return self.changes.updates(state)
+
+    def status_line(self):
+        hours, rest = divmod(int(self.elapsed), 3600)
+        parts = [f"{hours:3d}h{rest // 60:02d}m{rest % 60:02d}s"]
+        if "ota" in self.scenarios:
+            for update in self.ota:
+                if update.status == "downloading":
+                    detail = f" {update.progress()}%"
+                elif update.status == "installing":
+                    detail = f" {int(update.install_progress * 100)}%"
+                elif update.status == "error":
+                    detail = f" ({update.error})"
+                else:
+                    detail = ""
+                parts.append(f"{update.component} {update.status}{detail}")
+        if "modem" in self.scenarios:
+            modem = self.modem
+            parts.append(f"modem {modem.modem_state} {modem.access_tech} {modem.signal:3.0f}% cloud {modem.cloud}")
+        if "ble" in self.scenarios:
+            parts.append(f"ble {self.ble.status}")
+        return " | ".join(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Play OTA update, modem and BLE state sequences at real or compressed time'
+    )
+    parser.add_argument('--scenario', action='append', choices=['ota', 'modem', 'ble'],
+                        help='State sequence to play, may be repeated (default: all three)')
+    parser.add_argument('--speedup', type=float, default=10.0,
+                        help='Simulated seconds per real second, 1 for real time (default: 10)')
+    parser.add_argument('--rate', type=float, default=10.0,
+                        help='Updates per real second; raise it for bursty state churn (default: 10)')
+    parser.add_argument('--duration', type=float, default=0,
+                        help='Stop after this many simulated minutes (default: run until Ctrl+C)')
+    parser.add_argument('--ota-components', default='mdb,dbc',
+                        help='Comma-separated components receiving updates (default: mdb,dbc)')
+    parser.add_argument('--ota-interval', type=float, default=300.0,
+                        help='Mean simulated seconds between updates of a component (default: 300)')
+    parser.add_argument('--ota-failure-rate', type=float, default=0.2,
+                        help='Fraction of updates that fail while downloading or installing (default: 0.2)')
+    parser.add_argument('--signal', type=float, default=60.0,
+                        help='Mean modem signal quality in %% (default: 60)')
+    parser.add_argument('--signal-volatility', type=float, default=4.0,
+                        help='Signal quality random walk, in %% per square root of a second (default: 4)')
+    parser.add_argument('--dropout-interval', type=float, default=600.0,
+                        help='Mean simulated seconds between random modem dropouts (default: 600)')
+    parser.add_argument('--ble-connected', type=float, default=120.0,
+                        help='Mean simulated seconds a phone stays connected (default: 120)')
+    parser.add_argument('--ble-disconnected', type=float, default=180.0,
+                        help='Mean simulated seconds between phone connections (default: 180)')
+    parser.add_argument('--seed', help='Seed for the random sequences, so runs are repeatable')
+    parser.add_argument('--key-prefix', default='',
+                        help='Prefix for the Redis keys, e.g. sim:1: for a fleet vehicle (default: none)')
+    parser.add_argument('--sink', action='append', metavar='SPEC', help=SINK_HELP)
+    args = parser.parse_args()
+
+    if args.speedup <= 0 or args.rate <= 0:
+        parser.error('--speedup and --rate must be positive')
+    if args.dropout_interval <= 0:
+        parser.error('--dropout-interval must be positive')
+    args.scenario = args.scenario or ['ota', 'modem', 'ble']
+    args.ota_components = [c.strip() for c in args.ota_components.split(',') if c.strip()]
+    unknown = [c for c in args.ota_components if c not in OTA_COMPONENTS]
+    if unknown:
+        parser.error(f"--ota-components: unknown component {', '.join(unknown)} (choose from mdb, dbc)")
+    if args.seed is not None:
+        random.seed(args.seed)
+    try:
+        sink = open_sinks(args.sink)
+    except (ValueError, OSError) as e:
+        parser.error(f"--sink: {e}")
+
+    session = Session(args)
+    interval = 1.0 / args.rate
+    print(f"Playing {', '.join(args.scenario)} at {args.speedup:g}x, {args.rate:g} updates/s")
+    print("Press Ctrl+C to stop")
+
+    next_update = time.monotonic()
+    next_status = next_update
+    updates_written = 0
+    try:
+        while True:
+            updates = session.updates()
+            if updates:
+                sink.write(args.key_prefix, updates)
+                updates_written += 1
+
+            now = time.monotonic()
+            if now >= next_status:
+                # One status line per second however high the update rate
+                print(session.status_line())
+                next_status = now + 1.0
+            if args.duration and session.elapsed >= args.duration * 60:
+                break
+
+            next_update += interval
+            delay = next_update - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                # Fell behind: carry on from now instead of bursting to catch up
+                next_update = time.monotonic()
+            session.step(args.speedup * interval)
+        print(f"Finished after {session.elapsed / 60:.1f} simulated minutes")
+    except KeyboardInterrupt:
+        print("\nSimulation stopped")
+    finally:
+        sink.flush()
+        sink.close()
+        print(f"Wrote {updates_written} batches, {session.changes.fields_written} fields; sinks: {sink.stats()}")
+
+
+if __name__ == "__main__":
+    main()
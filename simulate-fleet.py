@@ -0,0 +1,458 @@
+#!/usr/bin/env python3
+# /// script
+# requires-python = ">=3.11"
+# dependencies = [
+#     "requests",
+# ]
+# ///
+
+import argparse
+import asyncio
+import collections
+import random
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from scootsim.metrics import METRICS_HELP, LatencyStats, Metrics, MetricsServer, register_sink_metrics
+from scootsim.route import (VALHALLA_URL, ElevationModel, Route, SpeedLimitMap, get_route, get_route_speed_limits,
+                            register_route_metrics)
+from scootsim.schedule import Schedule
+from scootsim.sinks import SINK_HELP, RedisSink, open_sinks
+from scootsim.state import load_state, save_state
+from scootsim.vehicle import RouteFollower
+
+
+async def get_redis_value(hash_name, field, default=None):
+    """Get a value from Redis using redis-cli without blocking the event loop"""
+    try:
+        process = await asyncio.create_subprocess_exec(
+            "redis-cli", "HGET", hash_name, field,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+        stdout, _ = await process.communicate()
+        value = stdout.decode().strip()
+        if process.returncode == 0 and value:
+            return value
+        return default
+    except OSError:
+        return default
+
+
+class SimulatedVehicle:
+    """A RouteFollower plus the runtime bookkeeping of one fleet member."""
+    def __init__(self, index, follower, key_prefix):
+        self.index = index
+        self.follower = follower
+        self.key_prefix = key_prefix
+        self.ready_to_drive = True
+        self.route_pending = False
+        self.route_retry_at = 0.0
+        self.route_requested_at = 0.0
+        self.destination = None     # Last navigation destination seen in Redis
+        self.roaming = True         # Riding to random destinations rather than a chosen one
+        self.ticks = 0
+        self.max_lag = 0.0          # Worst tick overrun since the last report, in seconds
+
+
+def vehicle_status(vehicle):
+    """paused, routing, moving or stopped, as counted in reports and metrics"""
+    if not vehicle.ready_to_drive:
+        return "paused"
+    if vehicle.route_pending:
+        return "routing"
+    return "moving" if vehicle.follower.current_speed > 0 else "stopped"
+
+
+async def refresh_vehicle_state(vehicle, routing_queue):
+    vehicle_state = await get_redis_value(vehicle.key_prefix + "vehicle", "state", "ready-to-drive")
+    ready_to_drive = (vehicle_state == "ready-to-drive")
+    if vehicle.ready_to_drive and not ready_to_drive:
+        print(f"Vehicle {vehicle.index} not ready (state: {vehicle_state}), pausing simulation...")
+    elif ready_to_drive and not vehicle.ready_to_drive:
+        # The scooter may have been moved while parked: resume in place if still on the route
+        gps_lat = await get_redis_value(vehicle.key_prefix + "gps", "latitude")
+        gps_lon = await get_redis_value(vehicle.key_prefix + "gps", "longitude")
+        if (gps_lat and gps_lon and not vehicle.follower.relocate(float(gps_lat), float(gps_lon))
+                and not vehicle.route_pending):
+            print(f"Vehicle {vehicle.index} resumed away from its route, rerouting")
+            vehicle.route_pending = True
+            routing_queue.put_nowait(vehicle)
+    vehicle.ready_to_drive = ready_to_drive
+
+
+async def refresh_destination(vehicle, routing_queue):
+    destination = await get_redis_value(vehicle.key_prefix + "navigation", "destination")
+    if destination and destination != vehicle.destination and not vehicle.route_pending:
+        print(f"Vehicle {vehicle.index}: navigation destination changed to {destination}, rerouting")
+        vehicle.route_pending = True
+        routing_queue.put_nowait(vehicle)
+    vehicle.destination = destination
+
+
+async def pubsub_listener(vehicles, routing_queue):
+    """Follow vehicle state and navigation destination changes via Redis pub/sub"""
+    channels = {}
+    for vehicle in vehicles:
+        channels[vehicle.key_prefix + "vehicle"] = (vehicle, "vehicle")
+        channels[vehicle.key_prefix + "navigation"] = (vehicle, "navigation")
+
+    while True:
+        process = await asyncio.create_subprocess_exec(
+            "redis-cli", "--raw", "SUBSCRIBE", *channels,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+        try:
+            while True:
+                # --raw prints each pub/sub reply as three lines: kind, channel, payload
+                kind = (await process.stdout.readline()).decode()
+                channel = (await process.stdout.readline()).decode().strip()
+                payload = (await process.stdout.readline()).decode().strip()
+                if not kind:
+                    break
+                if kind.strip() != "message" or channel not in channels:
+                    continue
+
+                vehicle, hash_name = channels[channel]
+                if hash_name == "vehicle" and payload == "state":
+                    await refresh_vehicle_state(vehicle, routing_queue)
+                elif hash_name == "navigation" and payload == "destination":
+                    await refresh_destination(vehicle, routing_queue)
+        finally:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+
+        print("Pub/sub connection lost, resubscribing in 1s...")
+        await asyncio.sleep(1)
+
+
+async def routing_worker(routing_queue, specified_destination, speed_limits_from_route, reroute_stats,
+                         valhalla_url, route_cache):
+    """Fetch routes off the event loop so slow HTTP never delays a tick"""
+    loop = asyncio.get_running_loop()
+    while True:
+        vehicle = await routing_queue.get()
+        follower = vehicle.follower
+        rerouting = follower.off_route
+
+        destination = vehicle.destination or await get_redis_value(vehicle.key_prefix + "navigation", "destination")
+        trip_destination = follower.trip_destination()
+        vehicle.roaming = not destination and not specified_destination
+        if destination:
+            dest_lat, dest_lon = map(float, destination.split(','))
+        elif trip_destination:
+            # Missed a turn or moved while parked: reroute to where the trip was going
+            dest_lat, dest_lon = trip_destination
+        elif specified_destination:
+            dest_lat, dest_lon = specified_destination
+        else:
+            # Generate random destination
+            dest_lat = follower.lat + (random.random() - 0.5) * 0.1  # approx 5km radius
+            dest_lon = follower.lon + (random.random() - 0.5) * 0.1
+
+        route_waypoints = await asyncio.to_thread(
+            get_route, (follower.lat, follower.lon), (dest_lat, dest_lon), valhalla_url, route_cache
+        )
+        if route_waypoints:
+            route_speed_limits = None
+            if speed_limits_from_route:
+                route_speed_limits = await asyncio.to_thread(get_route_speed_limits, route_waypoints,
+                                                                 valhalla_url, route_cache)
+            follower.set_route(route_waypoints, route_speed_limits, (dest_lat, dest_lon))
+            if rerouting:
+                # Includes the wait in the routing queue, which dominates when many vehicles reroute at once
+                reroute_stats.add(loop.time() - vehicle.route_requested_at)
+        else:
+            print(f"Vehicle {vehicle.index}: could not get a route, retrying in 5s")
+            vehicle.route_retry_at = loop.time() + 5
+        vehicle.route_pending = False
+
+
+async def motion_task(vehicle, sink, routing_queue, metrics, tick_duration, tick_lag, shutdown):
+    """Tick one vehicle on a fixed schedule until it has stopped after a shutdown request"""
+    loop = asyncio.get_running_loop()
+    follower = vehicle.follower
+    schedule = Schedule(follower.update_interval, loop.time)
+
+    while True:
+        tick_start = time.perf_counter()
+        if shutdown.is_set():
+            updates = follower.stop_tick()
+            if not updates:
+                return
+        elif not vehicle.ready_to_drive:
+            updates = follower.stop_tick()
+        elif follower.needs_route() or (vehicle.route_pending and follower.deviation_course is None):
+            # Completed the route to a chosen destination: stay parked until navigation sets a new one
+            parked = bool(follower.route_waypoints) and not vehicle.roaming
+            if not parked and not vehicle.route_pending and loop.time() >= vehicle.route_retry_at:
+                vehicle.route_pending = True
+                vehicle.route_requested_at = loop.time()
+                routing_queue.put_nowait(vehicle)
+            # Hold position (slowing down if needed) until the routing worker is done
+            updates = follower.stop_tick()
+        else:
+            if follower.off_route and not vehicle.route_pending and loop.time() >= vehicle.route_retry_at:
+                # Keep riding off route while the routing worker computes a new route
+                vehicle.route_pending = True
+                vehicle.route_requested_at = loop.time()
+                routing_queue.put_nowait(vehicle)
+            updates = follower.tick()
+
+        if updates:
+            sink.write(vehicle.key_prefix, updates)
+        vehicle.ticks += 1
+        tick_duration.observe(time.perf_counter() - tick_start)
+        metrics.beat()
+
+        delay, lag = schedule.advance()
+        tick_lag.observe(lag)
+        vehicle.max_lag = max(vehicle.max_lag, lag)
+        await asyncio.sleep(delay)
+
+
+async def checkpointer(vehicles, path, interval, state_writer):
+    """Save every vehicle's state periodically, so a crash loses at most one interval of riding"""
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(interval)
+        # Snapshot on the event loop so the state is consistent; encode and sync on the writer thread
+        checkpoints = [vehicle.follower.checkpoint() for vehicle in vehicles]
+        await loop.run_in_executor(state_writer, save_state, path, checkpoints)
+
+
+async def reporter(vehicles, sink, routing_queue, reroute_stats, report_interval, verbose):
+    loop = asyncio.get_running_loop()
+    last_ticks = 0
+    last_time = loop.time()
+    while True:
+        await asyncio.sleep(report_interval)
+        now = loop.time()
+        ticks = sum(vehicle.ticks for vehicle in vehicles)
+        tick_rate = (ticks - last_ticks) / (now - last_time)
+        last_ticks, last_time = ticks, now
+
+        statuses = collections.Counter(vehicle_status(v) for v in vehicles)
+        max_lag_ms = max(v.max_lag for v in vehicles) * 1000
+        for vehicle in vehicles:
+            vehicle.max_lag = 0.0
+
+        print(f"Fleet: {len(vehicles)} vehicles ({statuses['moving']} moving, {statuses['routing']} routing, "
+              f"{statuses['paused']} paused), "
+              f"{tick_rate:.1f} ticks/s, max tick lag {max_lag_ms:.1f}ms")
+        print(f"Sinks: {sink.stats()}; routing queue {routing_queue.qsize()}")
+        if reroute_stats.count:
+            print(f"Reroutes: {reroute_stats.summary()}")
+        if verbose:
+            print("\n".join(vehicles[0].follower.status_lines()))
+        print()
+
+
+async def restore_vehicle(follower, checkpoint, index, speed_limits_from_route, valhalla_url, route_cache):
+    """Continue a vehicle from its checkpoint.
+
+    Returns: False if the checkpoint is unusable and the vehicle starts from scratch
+    """
+    try:
+        route = Route.from_dict(checkpoint["route"]) if checkpoint.get("route") else None
+        route_speed_limits = None
+        if route is not None and speed_limits_from_route:
+            route_speed_limits = await asyncio.to_thread(get_route_speed_limits, route, valhalla_url, route_cache)
+        follower.restore(checkpoint, route, route_speed_limits)
+        return True
+    except (KeyError, TypeError, ValueError, IndexError, AttributeError) as e:
+        print(f"Vehicle {index}: ignoring unusable checkpoint ({e})")
+        return False
+
+
+async def run_fleet(args, sink, metrics):
+    specified_destination = (args.dest_lat, args.dest_lon) if args.dest_lat is not None else None
+
+    speed_limits = None
+    if args.speed_limits:
+        speed_limits = SpeedLimitMap.from_geojson(args.speed_limits)
+        print(f"Loaded {len(speed_limits.zones)} speed-limit zones from {args.speed_limits}")
+
+    # One model for all vehicles so each tile is mapped only once
+    elevation_model = ElevationModel(args.dem) if args.dem else None
+
+    saved = load_state(args.state_file) if args.state_file else []
+    resumed = 0
+    vehicles = []
+    for index in range(args.vehicles):
+        # Vehicle 0 drives the real MDB keys so the UI follows it
+        key_prefix = "" if index == 0 else args.key_prefix.format(index=index)
+        lat = args.start_lat + (random.uniform(-args.spread, args.spread) if index else 0)
+        lon = args.start_lon + (random.uniform(-args.spread, args.spread) if index else 0)
+        follower = RouteFollower(lat, lon, 0.0, 1.0 / args.rate, args.publish_progress, speed_limits,
+                                    elevation_model, args.deviation_probability)
+        if index < len(saved) and await restore_vehicle(follower, saved[index], index, args.speed_limits_from_route,
+                                                         args.valhalla_url, args.route_cache):
+            resumed += 1
+        else:
+            # Without a checkpoint only the odometer carries over, rounded to 100 m by the engine-ecu hash
+            follower.odometer = float(await get_redis_value(key_prefix + "engine-ecu", "odometer", 0))
+            follower.rounded_odometer = round(follower.odometer / 100) * 100
+        vehicle = SimulatedVehicle(index, follower, key_prefix)
+        vehicle.destination = await get_redis_value(key_prefix + "navigation", "destination")
+        vehicles.append(vehicle)
+
+    print(f"Starting {len(vehicles)} vehicles around latitude: {args.start_lat}, longitude: {args.start_lon} "
+          f"at {args.rate} updates/s" + (f", {resumed} resumed from {args.state_file}" if resumed else ""))
+    print("Press Ctrl+C to stop")
+
+    # The first SIGINT/SIGTERM brings every vehicle to a stop, a second one quits at once
+    loop = asyncio.get_running_loop()
+    shutdown = asyncio.Event()
+    main_task = asyncio.current_task()
+
+    def request_shutdown(signum):
+        if shutdown.is_set():
+            main_task.cancel()
+            return
+        print(f"\n{signum.name} received, bringing {len(vehicles)} vehicles to a stop (again to quit at once)")
+        shutdown.set()
+
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, request_shutdown, signum)
+
+    routing_queue = asyncio.Queue()
+    reroute_stats = LatencyStats()
+    for vehicle in vehicles:
+        await refresh_vehicle_state(vehicle, routing_queue)
+
+    # Tick counts already live on the vehicles, so scrapes read them instead of the hot loop counting twice
+    metrics.register("simulator_ticks_total", "counter", "Simulation ticks, all vehicles",
+                     lambda: sum(vehicle.ticks for vehicle in vehicles))
+    tick_duration = metrics.histogram("simulator_tick_duration_seconds", "Time spent computing one vehicle tick")
+    tick_lag = metrics.histogram("simulator_tick_lag_seconds", "How late each vehicle tick ran against its schedule")
+    metrics.register("simulator_vehicles", "gauge", "Simulated vehicles by state",
+                     lambda: dict(collections.Counter(vehicle_status(vehicle) for vehicle in vehicles)), "state")
+    metrics.register("simulator_routing_queue_depth", "gauge", "Vehicles waiting for a route",
+                     routing_queue.qsize)
+    metrics.register("simulator_reroutes_total", "counter", "Routes fetched after leaving the route",
+                     lambda: reroute_stats.count)
+
+    tasks = [
+        asyncio.create_task(reporter(vehicles, sink, routing_queue, reroute_stats, args.report_interval, args.verbose)),
+    ]
+    if sink.find(RedisSink):
+        tasks.append(asyncio.create_task(pubsub_listener(vehicles, routing_queue)))
+    tasks += [asyncio.create_task(routing_worker(routing_queue, specified_destination, args.speed_limits_from_route,
+                                                 reroute_stats, args.valhalla_url, args.route_cache))
+              for _ in range(args.routing_workers)]
+    state_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="state-writer")
+    if args.state_file:
+        tasks.append(asyncio.create_task(checkpointer(vehicles, args.state_file, args.checkpoint_interval,
+                                                      state_writer)))
+    motion_tasks = [asyncio.create_task(motion_task(vehicle, sink, routing_queue, metrics, tick_duration, tick_lag,
+                                                    shutdown))
+                    for vehicle in vehicles]
+
+    # Motion tasks end once their vehicle has stopped after a shutdown request; the
+    # others run until cancelled, so finishing early means one of them failed
+    motion = asyncio.gather(*motion_tasks)
+    background = asyncio.gather(*tasks)
+    try:
+        done, _ = await asyncio.wait([motion, background], return_when=asyncio.FIRST_COMPLETED)
+        for future in done:
+            future.result()
+        print("All vehicles stopped")
+    finally:
+        # Cancelling a gather cancels its tasks; waiting for them also retrieves the gathers' results
+        motion.cancel()
+        background.cancel()
+        await asyncio.gather(motion, background, return_exceptions=True)
+        # Let a periodic save still in flight land before the final one
+        state_writer.shutdown(wait=True)
+        if args.state_file and save_state(args.state_file, [vehicle.follower.checkpoint() for vehicle in vehicles]):
+            print(f"Saved state of {len(vehicles)} vehicles to {args.state_file}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Simulate one or more scooters following routes on an asyncio runtime'
+    )
+    parser.add_argument('start_lat', type=float, help='Starting latitude')
+    parser.add_argument('start_lon', type=float, help='Starting longitude')
+    parser.add_argument('dest_lat', nargs='?', type=float, help='Destination latitude (optional)')
+    parser.add_argument('dest_lon', nargs='?', type=float, help='Destination longitude (optional)')
+    parser.add_argument('--vehicles', type=int, default=1,
+                        help='Number of simulated vehicles (default: 1)')
+    parser.add_argument('--rate', type=float, default=1.0,
+                        help='Updates per second per vehicle (default: 1.0)')
+    parser.add_argument('--publish-progress', action='store_true',
+                        help='Publish remaining distance, ETA and next maneuver distance to the navigation hash')
+    parser.add_argument('--speed-limits', metavar='GEOJSON',
+                        help='Speed-limit zones (Polygon/LineString features with a maxspeed property)')
+    parser.add_argument('--speed-limits-from-route', action='store_true',
+                        help='Fetch speed limits along each route from Valhalla trace_attributes')
+    parser.add_argument('--dem', metavar='PATH',
+                        help='SRTM .hgt tile or directory of tiles for slope-aware power')
+    parser.add_argument('--deviation-probability', type=float, default=0.0,
+                        help='Chance (0-1) of missing each turn, going off route and rerouting (default: 0)')
+    parser.add_argument('--key-prefix', default='sim:{index}:',
+                        help='Redis key prefix for vehicles after the first (default: sim:{index}:)')
+    parser.add_argument('--spread', type=float, default=0.01,
+                        help='Random start offset in degrees for vehicles after the first (default: 0.01)')
+    parser.add_argument('--sink', action='append', metavar='SPEC', help=SINK_HELP)
+    parser.add_argument('--queue-size', type=int, default=100,
+                        help='Maximum queued Redis batches before new ones are merged into them (default: 100)')
+    parser.add_argument('--routing-workers', type=int, default=2,
+                        help='Concurrent route requests (default: 2)')
+    parser.add_argument('--route-cache', metavar='DIR',
+                        help='Directory for cached valhalla-route-*.json and speed-limit responses, read before asking '
+                             'Valhalla')
+    parser.add_argument('--valhalla-url', default=VALHALLA_URL,
+                        help=f'Routing backend for routes and speed limits not in the cache (default: {VALHALLA_URL})')
+    parser.add_argument('--metrics', metavar='ADDRESS', help=METRICS_HELP)
+    parser.add_argument('--state-file', metavar='PATH',
+                        help='Checkpoint every vehicle\'s position, odometer, charge and route here, '
+                             'and resume from it on start')
+    parser.add_argument('--checkpoint-interval', type=float, default=10.0,
+                        help='Seconds between checkpoints (default: 10)')
+    parser.add_argument('--report-interval', type=float, default=5.0,
+                        help='Seconds between status reports (default: 5)')
+    parser.add_argument('--verbose', action='store_true',
+                        help='Include the first vehicle\'s full status in each report')
+    args = parser.parse_args()
+
+    if (args.dest_lat is None) != (args.dest_lon is None):
+        parser.error('Both destination latitude and longitude must be provided together')
+    if args.vehicles < 1 or args.rate <= 0:
+        parser.error('--vehicles and --rate must be positive')
+    if args.checkpoint_interval <= 0:
+        parser.error('--checkpoint-interval must be positive')
+
+    try:
+        sink = open_sinks(args.sink, args.queue_size)
+    except (ValueError, OSError) as e:
+        parser.error(f"--sink: {e}")
+
+    metrics = Metrics(stale_after=max(30.0, 10 / args.rate))
+    register_route_metrics(metrics)
+    register_sink_metrics(metrics, sink)
+    metrics_server = None
+    if args.metrics:
+        try:
+            metrics_server = MetricsServer(metrics, args.metrics)
+        except (ValueError, OSError) as e:
+            parser.error(f"--metrics: {e}")
+        print(f"Serving metrics on {metrics_server.describe()}")
+
+    try:
+        asyncio.run(run_fleet(args, sink, metrics))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        print("\nSimulation stopped")
+    finally:
+        sink.flush()
+        sink.close()
+        if metrics_server:
+            metrics_server.close()
+
+
+if __name__ == "__main__":
+    main()
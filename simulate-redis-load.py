@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+# /// script
+# requires-python = ">=3.11"
+# dependencies = [
+#     "redis",
+# ]
+# ///
+
+import argparse
+import asyncio
+import random
+import resource
+import time
+
+import redis.asyncio as redis
+
+from scootsim.metrics import LatencyStats
+from scootsim.schedule import Schedule
+
+
+# Hashes written by the MDB services, used to name the generated hashes
+HASH_NAMES = ["gps", "engine-ecu", "battery:0", "battery:1", "vehicle", "navigation",
+              "speed-limit", "aux-battery", "cb-battery", "internet", "ble", "ota"]
+
+
+class LoadStats:
+    """Counters shared by all publishers and subscribers, reset after each report."""
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.batches = 0
+        self.commands = 0
+        self.messages = 0
+        self.refreshes = 0
+        self.errors = 0
+        self.max_lag = 0.0
+        self.fan_out = LatencyStats()
+        self.refresh_latency = LatencyStats()
+
+
+def hash_keys(key_prefix, publisher, count):
+    """Keys written by one publisher: real MDB hash names, numbered once they run out"""
+    keys = []
+    for i in range(count):
+        name = HASH_NAMES[i % len(HASH_NAMES)]
+        if i >= len(HASH_NAMES):
+            name = f"{name}:{i // len(HASH_NAMES)}"
+        keys.append(f"{key_prefix}{publisher}:{name}")
+    return keys
+
+
+async def publisher(client, keys, args, stats):
+    """Write every hash once per batch with the MULTI/HSET/PUBLISH/EXEC pattern of execute_redis_batch.
+
+    Each PUBLISH carries "field@send-time-in-ns" so subscribers can measure
+    the fan-out latency; the Dart repository only looks at the field name.
+    """
+    loop = asyncio.get_running_loop()
+    interval = 1.0 / args.rate if args.rate else 0.0
+    fields = [f"field-{i}" for i in range(args.fields)]
+    commands_per_batch = 2 + len(keys) * (1 + args.publish_fields)
+    schedule = Schedule(interval, loop.time)
+
+    while True:
+        pipe = client.pipeline(transaction=True)
+        for key in keys:
+            pipe.hset(key, mapping={field: f"{random.random():.6f}" for field in fields})
+            for field in fields[:args.publish_fields]:
+                pipe.publish(key, f"{field}@{time.time_ns()}")
+        try:
+            await pipe.execute()
+            stats.batches += 1
+            stats.commands += commands_per_batch
+        except redis.RedisError as e:
+            if not stats.errors:
+                print(f"Publisher error: {e}")
+            stats.errors += 1
+            await asyncio.sleep(1)
+
+        if not interval:
+            await asyncio.sleep(0)
+            continue
+        delay, lag = schedule.advance()
+        stats.max_lag = max(stats.max_lag, lag)
+        await asyncio.sleep(delay)
+
+
+async def stand_in_subscriber(client, pubsub_client, key, poll_interval, stats):
+    """Follow one hash the way the Dart SyncableCubit does.
+
+    A dedicated pub/sub connection per hash from pubsub_client, a 50 ms
+    trailing debounce on messages followed by HGETALL on the shared command
+    client, and a periodic HGETALL at poll_interval that restarts after each
+    pub/sub-triggered fetch.
+    """
+    loop = asyncio.get_running_loop()
+    refresh_at = None
+    poll_at = loop.time() + poll_interval
+
+    async def refresh():
+        start = time.perf_counter()
+        try:
+            await client.hgetall(key)
+            stats.refreshes += 1
+            stats.commands += 1
+            stats.refresh_latency.add(time.perf_counter() - start)
+        except redis.RedisError:
+            stats.errors += 1
+
+    pubsub = pubsub_client.pubsub()
+    await pubsub.subscribe(key)
+    try:
+        while True:
+            now = loop.time()
+            deadline = min(poll_at, refresh_at) if refresh_at is not None else poll_at
+            message = await pubsub.get_message(ignore_subscribe_messages=True,
+                                               timeout=max(0.0, deadline - now))
+            if message is not None and message["type"] == "message":
+                received = time.time_ns()
+                _, _, sent = message["data"].decode().partition("@")
+                if sent.isdigit():
+                    stats.fan_out.add((received - int(sent)) / 1e9)
+                stats.messages += 1
+                refresh_at = loop.time() + 0.05
+
+            now = loop.time()
+            if refresh_at is not None and now >= refresh_at:
+                refresh_at = None
+                await refresh()
+                poll_at = loop.time() + poll_interval
+            elif now >= poll_at:
+                await refresh()
+                poll_at = loop.time() + poll_interval
+    finally:
+        await pubsub.aclose()
+
+
+async def server_counters(client):
+    """Server CPU seconds (user + sys) and total commands processed"""
+    info = await client.info()
+    return info["used_cpu_user"] + info["used_cpu_sys"], info["total_commands_processed"]
+
+
+def format_latency(stats):
+    if not stats.count:
+        return "none"
+    return (f"p50 {stats.percentile(0.5) * 1000:.2f}ms, p95 {stats.percentile(0.95) * 1000:.2f}ms, "
+            f"p99 {stats.percentile(0.99) * 1000:.2f}ms, max {stats.max * 1000:.2f}ms")
+
+
+async def reporter(client, stats, totals, report_interval):
+    """Print achieved throughput, latency and CPU every report_interval seconds"""
+    loop = asyncio.get_running_loop()
+    last_time = loop.time()
+    last_cpu = time.process_time()
+    last_server_cpu, last_server_commands = await server_counters(client)
+
+    while True:
+        await asyncio.sleep(report_interval)
+        now = loop.time()
+        elapsed = now - last_time
+        cpu = time.process_time()
+        try:
+            server_cpu, server_commands = await server_counters(client)
+        except redis.RedisError as e:
+            print(f"Could not read server INFO: {e}")
+            continue
+
+        print(f"Publish: {stats.batches / elapsed:.1f} batches/s, {stats.commands / elapsed:.0f} client ops/s, "
+              f"{(server_commands - last_server_commands) / elapsed:.0f} server ops/s, "
+              f"max lag {stats.max_lag * 1000:.1f}ms, {stats.errors} errors")
+        print(f"Fan-out: {stats.messages / elapsed:.0f} messages/s, {format_latency(stats.fan_out)}")
+        print(f"HGETALL: {stats.refreshes / elapsed:.0f}/s, {format_latency(stats.refresh_latency)}")
+        print(f"CPU: server {(server_cpu - last_server_cpu) / elapsed * 100:.1f}%, "
+              f"load generator {(cpu - last_cpu) / elapsed * 100:.1f}% of one core")
+        print()
+
+        totals.append((elapsed, stats.commands, server_commands - last_server_commands,
+                       server_cpu - last_server_cpu, stats.fan_out))
+        stats.reset()
+        last_time, last_cpu = now, cpu
+        last_server_cpu, last_server_commands = server_cpu, server_commands
+
+
+async def run_load(args):
+    # Like RedisMDBRepository, commands share a bounded pool and wait for a free connection
+    client = redis.Redis.from_pool(redis.BlockingConnectionPool(
+        host=args.host, port=args.port, max_connections=args.max_connections, timeout=None))
+    try:
+        await client.ping()
+    except redis.RedisError as e:
+        print(f"Could not connect to Redis at {args.host}:{args.port}: {e}")
+        return
+
+    keys = [hash_keys(args.key_prefix, p, args.hashes) for p in range(args.publishers)]
+    all_keys = [key for publisher_keys in keys for key in publisher_keys]
+    # ...while every subscription gets a dedicated connection outside that pool
+    pubsub_client = redis.Redis(host=args.host, port=args.port,
+                                max_connections=max(1, args.subscribers * len(all_keys)))
+    stats = LoadStats()
+    totals = []
+
+    rate = f"{args.rate} batches/s" if args.rate else "unthrottled"
+    print(f"Load: {args.publishers} publishers x {args.hashes} hashes x {args.fields} fields at {rate}, "
+          f"{args.subscribers} subscribers on {len(all_keys)} channels, against {args.host}:{args.port}")
+    print("Press Ctrl+C to stop")
+    print()
+
+    tasks = [asyncio.create_task(stand_in_subscriber(client, pubsub_client, key, args.poll_interval, stats))
+             for _ in range(args.subscribers) for key in all_keys]
+    # Let the subscriptions settle before publishing
+    await asyncio.sleep(0.5)
+    tasks += [asyncio.create_task(publisher(client, publisher_keys, args, stats)) for publisher_keys in keys]
+    tasks.append(asyncio.create_task(reporter(client, stats, totals, args.report_interval)))
+
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=args.duration or None, return_when=asyncio.FIRST_EXCEPTION)
+        for task in done:
+            if task.exception():
+                print(f"Load task failed: {task.exception()}")
+    finally:
+        pending = tasks
+        while pending:
+            # redis-py's get_message() can swallow a cancellation, so repeat it until every task has ended
+            for task in pending:
+                task.cancel()
+            _, pending = await asyncio.wait(pending, timeout=1)
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if args.cleanup:
+            await client.delete(*all_keys)
+        await client.aclose()
+        await pubsub_client.aclose()
+        print_totals(totals)
+
+
+def print_totals(totals):
+    """Summarize all completed report intervals"""
+    if not totals:
+        return
+    elapsed = sum(t[0] for t in totals)
+    print(f"Total over {elapsed:.0f}s: {sum(t[1] for t in totals) / elapsed:.0f} client ops/s, "
+          f"{sum(t[2] for t in totals) / elapsed:.0f} server ops/s, "
+          f"server CPU {sum(t[3] for t in totals) / elapsed * 100:.1f}%, "
+          f"worst fan-out p99 {max(t[4].percentile(0.99) for t in totals) * 1000:.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Generate MDB-style HSET+PUBLISH load on Redis with stand-in UI subscribers'
+    )
+    parser.add_argument('--host', default='127.0.0.1', help='Redis host (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=6379, help='Redis port (default: 6379)')
+    parser.add_argument('--publishers', type=int, default=4,
+                        help='Concurrent publishing services (default: 4)')
+    parser.add_argument('--rate', type=float, default=10.0,
+                        help='Batches per second per publisher, 0 for as fast as possible (default: 10)')
+    parser.add_argument('--hashes', type=int, default=3,
+                        help='Hashes written per batch by each publisher (default: 3)')
+    parser.add_argument('--fields', type=int, default=4,
+                        help='Fields per HSET (default: 4)')
+    parser.add_argument('--publish-fields', type=int, default=1,
+                        help='PUBLISH notifications per hash and batch (default: 1)')
+    parser.add_argument('--subscribers', type=int, default=1,
+                        help='Stand-in UI instances, each subscribed to every hash (default: 1)')
+    parser.add_argument('--poll-interval', type=float, default=0.5,
+                        help='Periodic HGETALL interval of the stand-in subscribers (default: 0.5)')
+    parser.add_argument('--max-connections', type=int, default=256,
+                        help='Command connection pool shared by the publishers and HGETALL refreshes; '
+                             'subscriptions use their own connections (default: 256)')
+    parser.add_argument('--key-prefix', default='load:',
+                        help='Prefix for generated keys, keeping the real MDB hashes untouched (default: load:)')
+    parser.add_argument('--duration', type=float, default=0,
+                        help='Stop after this many seconds (default: run until Ctrl+C)')
+    parser.add_argument('--report-interval', type=float, default=5.0,
+                        help='Seconds between reports (default: 5)')
+    parser.add_argument('--cleanup', action='store_true',
+                        help='Delete the generated hashes when done')
+    args = parser.parse_args()
+
+    if args.publishers < 1 or args.hashes < 1 or args.rate < 0 or args.subscribers < 0:
+        parser.error('--publishers and --hashes must be positive, --rate and --subscribers not negative')
+    args.publish_fields = min(args.publish_fields, args.fields)
+
+    # Every publisher holds a command connection while its pipeline runs, and the reporter needs one more
+    if args.max_connections < args.publishers + 1:
+        parser.error(f'--max-connections must be at least {args.publishers + 1}, '
+                     'one per publisher plus one for the reports')
+    subscriptions = args.subscribers * args.publishers * args.hashes
+    commands = min(args.max_connections, args.publishers + 1 + subscriptions)
+    soft_limit, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft_limit != resource.RLIM_INFINITY and subscriptions + commands + 16 > soft_limit:
+        parser.error(f'{subscriptions} subscriptions and {commands} command connections need more than the '
+                     f'{soft_limit} open files allowed; raise it with ulimit -n or use fewer subscribers')
+
+    try:
+        asyncio.run(run_load(args))
+    except KeyboardInterrupt:
+        print("\nLoad generation stopped")
+
+
+if __name__ == "__main__":
+    main()
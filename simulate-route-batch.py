@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# /// script
+# requires-python = ">=3.11"
+# dependencies = [
+#     "requests",
+# ]
+# ///
+
+import argparse
+import csv
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+from scootsim.route import VALHALLA_URL, ElevationModel, Route, SpeedLimitMap, get_route
+from scootsim.vehicle import RouteFollower
+
+
+# Per-route result columns, in output order
+COLUMNS = ["id", "start", "destination", "distance_km", "route_time_s", "ride_time_s", "eta_error_pct",
+           "avg_speed_kmh", "discharge_wh", "regen_wh", "net_wh", "wh_per_km", "turns", "sharp_turns", "status"]
+
+# Set in each worker process by init_worker()
+worker_config = {}
+
+
+def read_trips(path):
+    """Read start/destination pairs from a CSV file.
+
+    With a header, the columns start_lat, start_lon, dest_lat, dest_lon and
+    an optional id are used; without one, the first four columns are taken
+    in that order and rows are numbered.
+    """
+    with open(path, newline="") as f:
+        rows = [row for row in csv.reader(f) if row and not row[0].startswith("#")]
+    if not rows:
+        return []
+
+    header = [name.strip() for name in rows[0]]
+    if "start_lat" in header:
+        columns = [header.index(name) for name in ("start_lat", "start_lon", "dest_lat", "dest_lon")]
+        id_column = header.index("id") if "id" in header else None
+        rows = rows[1:]
+    else:
+        columns = [0, 1, 2, 3]
+        id_column = None
+
+    trips = []
+    for number, row in enumerate(rows, 1):
+        start_lat, start_lon, dest_lat, dest_lon = (float(row[i]) for i in columns)
+        trip_id = row[id_column].strip() if id_column is not None else str(number)
+        trips.append((trip_id, (start_lat, start_lon), (dest_lat, dest_lon)))
+    return trips
+
+
+def init_worker(speed_limits_path, dem_path, update_interval, max_ride_time, seed):
+    """Load the shared inputs once per worker process"""
+    worker_config["speed_limits"] = SpeedLimitMap.from_geojson(speed_limits_path) if speed_limits_path else None
+    worker_config["elevation_model"] = ElevationModel(dem_path) if dem_path else None
+    worker_config["update_interval"] = update_interval
+    worker_config["max_ride_time"] = max_ride_time
+    worker_config["seed"] = seed
+
+
+def simulate_trip(trip_id, shared_memory_name):
+    """Ride one route headless in a worker process, attached to the route without copying it.
+
+    Returns: dict of result columns
+    """
+    random.seed(f"{worker_config['seed']}:{trip_id}")
+    route = Route.from_shared_memory(shared_memory_name)
+    try:
+        start = route[0]
+        update_interval = worker_config["update_interval"]
+        follower = RouteFollower(start[0], start[1], 0.0, update_interval,
+                                    speed_limits=worker_config["speed_limits"],
+                                    elevation_model=worker_config["elevation_model"])
+        follower.set_route(route)
+
+        ticks = 0
+        max_ticks = worker_config["max_ride_time"] / update_interval
+        while follower.phase != "arrived" and ticks < max_ticks:
+            follower.tick()
+            ticks += 1
+
+        ride_time = ticks * update_interval
+        distance_km = route.length / 1000
+        net_wh = follower.total_discharge_wh - follower.total_regen_wh
+        profile = follower.speed_profile
+        return {
+            "ride_time_s": round(ride_time),
+            "eta_error_pct": round((route.duration - ride_time) / ride_time * 100, 1) if route.duration and ride_time else "",
+            "avg_speed_kmh": round(distance_km / (ride_time / 3600), 1) if ride_time else 0.0,
+            "discharge_wh": round(follower.total_discharge_wh, 1),
+            "regen_wh": round(follower.total_regen_wh, 1),
+            "net_wh": round(net_wh, 1),
+            "wh_per_km": round(net_wh / distance_km, 1) if distance_km else 0.0,
+            "sharp_turns": sum(1 for angle in profile.turn_angles if angle >= 60),
+            "status": "ok" if follower.phase == "arrived" else "timeout",
+        }
+    finally:
+        route.close()
+
+
+def format_table(results):
+    """Align result rows as a plain-text table"""
+    rows = [COLUMNS] + [[str(result.get(column, "")) for column in COLUMNS] for result in results]
+    widths = [max(len(row[i]) for row in rows) for i in range(len(COLUMNS))]
+    return "\n".join("  ".join(value.rjust(width) for value, width in zip(row, widths)) for row in rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Route and ride a batch of start/destination pairs, reporting distance, time, energy and turns'
+    )
+    parser.add_argument('trips', help='CSV of start_lat,start_lon,dest_lat,dest_lon[,id] rows')
+    parser.add_argument('--output', metavar='CSV', help='Also write the results table to a CSV file')
+    parser.add_argument('--route-cache', metavar='DIR',
+                        help='Directory for cached valhalla-route-*.json responses, read before asking Valhalla '
+                             '(default: no cache)')
+    parser.add_argument('--valhalla-url', default=VALHALLA_URL,
+                        help=f'Routing backend for routes not in the cache (default: {VALHALLA_URL})')
+    parser.add_argument('--routing-concurrency', type=int, default=4,
+                        help='Concurrent route requests (default: 4)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Physics worker processes (default: one per CPU)')
+    parser.add_argument('--rate', type=float, default=1.0,
+                        help='Physics updates per simulated second (default: 1.0)')
+    parser.add_argument('--max-ride-time', type=float, default=4 * 3600,
+                        help='Give up on a ride after this many simulated seconds (default: 14400)')
+    parser.add_argument('--speed-limits', metavar='GEOJSON',
+                        help='Speed-limit zones (Polygon/LineString features with a maxspeed property)')
+    parser.add_argument('--dem', metavar='PATH',
+                        help='SRTM .hgt tile or directory of tiles for slope-aware power')
+    parser.add_argument('--seed', default='0',
+                        help='Seed for traffic and rider behaviour, so runs are repeatable (default: 0)')
+    args = parser.parse_args()
+
+    if args.rate <= 0 or args.routing_concurrency < 1:
+        parser.error('--rate and --routing-concurrency must be positive')
+    try:
+        trips = read_trips(args.trips)
+    except (OSError, ValueError, IndexError) as e:
+        print(f"Could not read trips from '{args.trips}': {e}")
+        sys.exit(1)
+
+    print(f"Evaluating {len(trips)} trips")
+    started = time.perf_counter()
+    results = {trip_id: {"id": trip_id, "start": f"{start[0]},{start[1]}",
+                         "destination": f"{end[0]},{end[1]}", "status": "no route"}
+               for trip_id, start, end in trips}
+    shared_blocks = {}
+    simulations = {}
+
+    with ThreadPoolExecutor(max_workers=args.routing_concurrency) as routing_pool, \
+            ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker,
+                                initargs=(args.speed_limits, args.dem, 1.0 / args.rate,
+                                          args.max_ride_time, args.seed)) as physics_pool:
+        routing = {routing_pool.submit(get_route, start, end, args.valhalla_url, args.route_cache): trip_id
+                   for trip_id, start, end in trips}
+
+        try:
+            # Hand each route to the physics pool as soon as it arrives
+            for future in as_completed(routing):
+                trip_id = routing[future]
+                route = future.result()
+                if route is None or len(route) < 2:
+                    continue
+                result = results[trip_id]
+                result["distance_km"] = round(route.length / 1000, 2)
+                result["route_time_s"] = round(route.duration) if route.duration else ""
+                result["turns"] = max(0, len(route.maneuver_indices) - 1)   # The last maneuver is the arrival
+
+                block = route.to_shared_memory()
+                shared_blocks[trip_id] = block
+                simulations[physics_pool.submit(simulate_trip, trip_id, block.name)] = trip_id
+            routed_at = time.perf_counter()
+
+            for future in as_completed(simulations):
+                trip_id = simulations[future]
+                try:
+                    results[trip_id].update(future.result())
+                except Exception as e:
+                    results[trip_id]["status"] = f"failed: {e}"
+        finally:
+            for block in shared_blocks.values():
+                block.close()
+                block.unlink()
+
+    ordered = [results[trip_id] for trip_id, _, _ in trips]
+    print(format_table(ordered))
+    if args.output:
+        with open(args.output, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=COLUMNS)
+            writer.writeheader()
+            writer.writerows(ordered)
+
+    elapsed = time.perf_counter() - started
+    ok = sum(1 for result in ordered if result["status"] == "ok")
+    print(f"\n{ok}/{len(trips)} trips simulated in {elapsed:.1f}s (all routes ready after {routed_at - started:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
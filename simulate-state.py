@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+
+# Hashes read by the Dart @StateClass types (lib/state/*.dart)
+STATE_HASHES = [
+    "vehicle",
+    "engine-ecu",
+    "battery:0",
+    "battery:1",
+    "aux-battery",
+    "cb-battery",
+    "gps",
+    "navigation",
+    "speed-limit",
+    "internet",
+    "ble",
+    "ota",
+    "dashboard",
+    "settings",
+    "usb",
+    "auto-standby",
+]
+
+# Marker echoed between HGETALL replies so one redis-cli call can be split per hash
+SNAPSHOT_MARKER = "--8<-- "
+
+BASE_STATE = {
+    "vehicle": {
+        "state": "parked",
+        "kickstand": "down",
+        "blinker:state": "off",
+        "blinker:switch": "off",
+        "brake:left": "off",
+        "brake:right": "off",
+        "handlebar:lock-sensor": "unlocked",
+        "handlebar:position": "on-place",
+        "seatbox:lock": "closed",
+        "seatbox:button": "off",
+        "horn-button": "off",
+    },
+    "engine-ecu": {
+        "state": "off",
+        "kers": "on",
+        "kers-reason-off": "none",
+        "speed": "0",
+        "raw-speed": "0",
+        "rpm": "0",
+        "throttle": "off",
+        "motor:voltage": "52000",
+        "motor:current": "0",
+        "odometer": "1234500",
+        "temperature": "24",
+    },
+    "battery:0": {
+        "present": "true",
+        "state": "idle",
+        "voltage": "52000",
+        "current": "0",
+        "charge": "80",
+        "temperature:0": "22",
+        "temperature:1": "22",
+        "temperature:2": "23",
+        "temperature:3": "23",
+        "temperature-state": "ideal",
+        "cycle-count": "87",
+        "state-of-health": "97",
+    },
+    "battery:1": {
+        "present": "false",
+        "state": "unknown",
+    },
+    "aux-battery": {
+        "voltage": "12700",
+        "charge": "100",
+        "charge-status": "float-charge",
+    },
+    "cb-battery": {
+        "present": "true",
+        "charge": "100",
+        "current": "0",
+        "temperature": "24",
+        "charge-status": "not-charging",
+        "state-of-health": "100",
+    },
+    "gps": {
+        "latitude": "52.520008",
+        "longitude": "13.404954",
+        "course": "0",
+        "speed": "0",
+        "altitude": "34",
+        "state": "fix-established",
+    },
+    "navigation": {},
+    "internet": {
+        "modem-state": "connected",
+        "status": "connected",
+        "unu-cloud": "connected",
+        "access-tech": "LTE",
+        "signal-quality": "75",
+        "ip-address": "10.64.0.2",
+    },
+    "ble": {
+        "status": "disconnected",
+        "service-health": "ok",
+    },
+    "ota": {
+        "status:dbc": "idle",
+        "status:mdb": "idle",
+    },
+}
+
+# Per-profile overrides applied on top of BASE_STATE
+PROFILE_OVERRIDES = {
+    "parked": {},
+    "ready-to-drive": {
+        "vehicle": {"state": "ready-to-drive", "kickstand": "up"},
+        "engine-ecu": {"state": "on"},
+        "battery:0": {"state": "active"},
+    },
+    "charging": {
+        "vehicle": {"state": "stand-by", "handlebar:lock-sensor": "locked"},
+        "battery:0": {"state": "active", "charge": "45", "voltage": "49800", "current": "7000"},
+        "aux-battery": {"charge-status": "bulk-charge", "voltage": "13800"},
+        "cb-battery": {"charge-status": "charging", "current": "500", "charge": "85"},
+    },
+    "low-battery": {
+        "vehicle": {"state": "ready-to-drive", "kickstand": "up"},
+        "engine-ecu": {"state": "on", "motor:voltage": "44500"},
+        "battery:0": {"state": "active", "charge": "8", "voltage": "44500"},
+        "aux-battery": {"charge": "40", "voltage": "11900", "charge-status": "not-charging"},
+        "cb-battery": {"charge": "15"},
+    },
+}
+
+
+def quote_redis_arg(value):
+    """Quote a value so redis-cli keeps spaces and special characters intact"""
+    escaped = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return f'"{escaped}"'
+
+
+def execute_redis_batch(commands):
+    """Execute multiple Redis commands in a single MULTI transaction"""
+    redis_input = "MULTI\n" + "\n".join(commands) + "\nEXEC"
+    subprocess.run(["redis-cli"], input=redis_input, text=True,
+                   check=True, stdout=subprocess.DEVNULL)
+
+
+def build_profile(name):
+    """Merge a named profile's overrides onto the base state"""
+    state = {hash_name: dict(fields) for hash_name, fields in BASE_STATE.items()}
+    for hash_name, fields in PROFILE_OVERRIDES[name].items():
+        state.setdefault(hash_name, {}).update(fields)
+    return state
+
+
+def read_profile(profile):
+    """Resolve a built-in profile name or a JSON snapshot file"""
+    if profile in PROFILE_OVERRIDES:
+        return build_profile(profile)
+    with open(profile) as f:
+        return json.load(f)
+
+
+def refresh_gps_fix(state):
+    """Stamp the GPS hash with the current time so the UI sees a recent fix"""
+    if "gps" in state and state["gps"]:
+        now = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        state["gps"]["updated"] = now
+        state["gps"]["timestamp"] = now
+
+
+def load_state(state):
+    """Replace each hash with the given fields and notify subscribers, in one transaction.
+
+    Returns: number of fields written
+    """
+    commands = []
+    field_count = 0
+    for hash_name, fields in state.items():
+        commands.append(f"DEL {hash_name}")
+        if fields:
+            args = " ".join(f"{quote_redis_arg(k)} {quote_redis_arg(v)}" for k, v in fields.items())
+            commands.append(f"HSET {hash_name} {args}")
+            field_count += len(fields)
+        # The Dart SyncableCubit refetches the whole hash on any message
+        commands.append(f"PUBLISH {hash_name} {quote_redis_arg(next(iter(fields), 'state'))}")
+    execute_redis_batch(commands)
+    return field_count
+
+
+def snapshot_state(hash_names):
+    """Read all given hashes with a single redis-cli call"""
+    redis_input = "\n".join(
+        f"ECHO {quote_redis_arg(SNAPSHOT_MARKER + name)}\nHGETALL {name}" for name in hash_names
+    )
+    result = subprocess.run(["redis-cli", "--raw"], input=redis_input, text=True,
+                            capture_output=True, check=True)
+
+    state = {}
+    current = None
+    pending_field = None
+    for line in result.stdout.split("\n"):
+        if line.startswith(SNAPSHOT_MARKER):
+            current = state.setdefault(line[len(SNAPSHOT_MARKER):], {})
+            pending_field = None
+        elif current is None:
+            continue
+        elif pending_field is None:
+            if line:
+                pending_field = line
+        else:
+            current[pending_field] = line
+            pending_field = None
+    return state
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Bootstrap or snapshot the MDB Redis state used by the UI'
+    )
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    load_parser = subparsers.add_parser('load', help='Load a built-in profile or a snapshot file')
+    load_parser.add_argument('profile', help=f"Profile name ({', '.join(PROFILE_OVERRIDES)}) or JSON file")
+    load_parser.add_argument('--keep-timestamps', action='store_true',
+                             help='Do not refresh gps updated/timestamp to the current time')
+
+    snapshot_parser = subparsers.add_parser('snapshot', help='Save the current state to a JSON file')
+    snapshot_parser.add_argument('file', help='Output JSON file ("-" for stdout)')
+    snapshot_parser.add_argument('--keys', nargs='+', default=STATE_HASHES,
+                                 help='Hashes to snapshot (default: all UI state hashes)')
+
+    subparsers.add_parser('list', help='List built-in profiles')
+    args = parser.parse_args()
+
+    if args.command == 'list':
+        for name in PROFILE_OVERRIDES:
+            print(name)
+        return
+
+    try:
+        if args.command == 'load':
+            try:
+                state = read_profile(args.profile)
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"Could not read profile '{args.profile}': {e}")
+                sys.exit(1)
+            if not args.keep_timestamps:
+                refresh_gps_fix(state)
+
+            start = time.perf_counter()
+            field_count = load_state(state)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            print(f"Loaded '{args.profile}': {len(state)} hashes, {field_count} fields in {elapsed_ms:.1f} ms")
+
+        elif args.command == 'snapshot':
+            start = time.perf_counter()
+            state = snapshot_state(args.keys)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            output = json.dumps(state, indent=2, sort_keys=True)
+            if args.file == '-':
+                print(output)
+            else:
+                with open(args.file, 'w') as f:
+                    f.write(output + "\n")
+                field_count = sum(len(fields) for fields in state.values())
+                print(f"Saved {len(state)} hashes, {field_count} fields to {args.file} in {elapsed_ms:.1f} ms")
+    except subprocess.CalledProcessError as e:
+        print(f"redis-cli failed: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()